@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+
+from pre_processing.pre_processing import load_processed
+from splitter.series_store import SeriesStore
+from splitter.train_val_split import SeriesSplit, split_years_for
+from model.registry import available_models, get_model, model_label, model_params
+from model.cache import ForecastCache, cached_predict
+from evaluation.metrics import METRIC_NAMES, compute_metrics_cube
+
+# Ajustes para execução em lote: o paralelismo fica no pool de processos, não em cada modelo
+BATCH_PARAMS = {
+    "random_forest": {"n_jobs": 1},
+    # Ajuste que não converge não pode travar o lote: limite de iterações e de tempo, com fallback
+    "arima": {"maxiter": 50, "timeout": 30.0},
+}
+
+
+def _write_partitioned(df, out_dir, name, chunk_id):
+    for bioma, part in df.groupby("bioma", sort=True):
+        part_dir = os.path.join(out_dir, name, f"bioma={bioma}")
+        os.makedirs(part_dir, exist_ok=True)
+        part.drop(columns="bioma").to_parquet(os.path.join(part_dir, f"part-{chunk_id:05d}.parquet"), index=False)
+
+
+def run_chunk(chunk_id, items, model_names, out_dir, train_end=2020, val_start=2021, val_end=2023,
+              cache_dir=None, future_years=None):
+    warnings.filterwarnings("ignore")
+    cache = ForecastCache(cache_dir) if cache_dir else None
+
+    val_years = np.arange(val_start, val_end + 1)
+    truth = np.full((len(items), len(val_years)), np.nan)
+    cube = np.full((len(items), len(model_names), len(val_years)), np.nan)
+
+    forecast_rows = []
+    error_rows = []
+    keys = []
+
+    for i, ((municipio_id, bioma), years, values) in enumerate(items):
+        keys.append((municipio_id, bioma))
+        try:
+            split = SeriesSplit(years, values, train_end=train_end, val_start=val_start, val_end=val_end,
+                                future_years=future_years)
+        except ValueError as e:
+            error_rows.append({"id_municipio": municipio_id, "bioma": bioma, "modelo": None, "erro": str(e)})
+            continue
+        truth[i, split.val_years - val_start] = split.val_values
+
+        for m, name in enumerate(model_names):
+            label = model_label(name)
+            predictor = get_model(name)
+            params = {**model_params(name), **BATCH_PARAMS.get(name, {})}
+            try:
+                result = cached_predict(predictor, split, cache, **params)
+            except Exception as e:
+                error_rows.append({"id_municipio": municipio_id, "bioma": bioma, "modelo": label,
+                                   "erro": f"{type(e).__name__}: {e}"})
+                continue
+            if result.get("fallback"):
+                error_rows.append({"id_municipio": municipio_id, "bioma": bioma, "modelo": label,
+                                   "erro": result["note"]})
+
+            for year, pred in result["validation_predictions"].items():
+                cube[i, m, int(year) - val_start] = pred
+                forecast_rows.append((municipio_id, bioma, label, int(year), "validacao", float(pred)))
+            for year, pred in zip(result["pred_years"], result["predictions"]):
+                forecast_rows.append((municipio_id, bioma, label, int(year), "previsao", float(pred)))
+
+    metrics = compute_metrics_cube(truth, cube)
+    metric_rows = []
+    for i, (municipio_id, bioma) in enumerate(keys):
+        for m, name in enumerate(model_names):
+            metric_rows.append({"id_municipio": municipio_id, "bioma": bioma, "Modelo": model_label(name),
+                                **{metric: metrics[metric][i, m] for metric in METRIC_NAMES}})
+
+    forecasts = pd.DataFrame(forecast_rows,
+                             columns=["id_municipio", "bioma", "Modelo", "ano", "tipo", "previsto"])
+    _write_partitioned(forecasts, out_dir, "previsoes", chunk_id)
+    _write_partitioned(pd.DataFrame(metric_rows), out_dir, "metricas", chunk_id)
+    if error_rows:
+        _write_partitioned(pd.DataFrame(error_rows), out_dir, "erros", chunk_id)
+
+    # O marcador só é gravado depois das saídas: um lote sem marcador é refeito por inteiro
+    with open(os.path.join(out_dir, "_done", f"chunk-{chunk_id:05d}"), "w") as f:
+        f.write(str(len(items)))
+
+    return chunk_id, len(items), len(error_rows)
+
+
+def select_series(store, ids=None, biomas=None):
+    keys = list(store.keys())
+    if ids is not None:
+        ids = set(ids)
+        keys = [k for k in keys if k[0] in ids]
+    if biomas is not None:
+        biomas = set(biomas)
+        keys = [k for k in keys if k[1] in biomas]
+    return keys
+
+
+def run_batch(processed_path, out_dir, ids=None, biomas=None, model_names=None, n_workers=None,
+              chunk_size=50, train_end=None, val_start=None, val_end=None, cache_dir=None, horizon=5):
+    if model_names is None:
+        model_names = available_models()
+    unknown = [name for name in model_names if name not in available_models()]
+    if unknown:
+        raise ValueError(f"Modelos desconhecidos: {unknown}. Disponíveis: {available_models()}")
+
+    df = load_processed(processed_path, columns=["id_municipio", "bioma", "ano", "desmatado"], biomas=biomas)
+
+    # Janelas não informadas acompanham o último ano publicado (ou o fim de validação escolhido); a previsão
+    # começa no ano seguinte à validação
+    windows = split_years_for(val_end if val_end is not None else df["ano"].max(), horizon=horizon)
+    train_end = int(train_end) if train_end is not None else windows["train_end"]
+    val_start = int(val_start) if val_start is not None else train_end + 1
+    val_end = windows["val_end"]
+    future_years = windows["future_years"]
+
+    config = {
+        "processed_path": os.path.abspath(processed_path),
+        "ids": sorted(ids) if ids is not None else None,
+        "biomas": sorted(biomas) if biomas is not None else None,
+        "models": model_names,
+        "chunk_size": chunk_size,
+        "train_end": train_end,
+        "val_start": val_start,
+        "val_end": val_end,
+        "future_years": future_years,
+    }
+
+    os.makedirs(os.path.join(out_dir, "_done"), exist_ok=True)
+    manifest_path = os.path.join(out_dir, "_manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            if json.load(f) != config:
+                raise ValueError(f"{out_dir} contém uma execução com outra configuração — use outro diretório.")
+    else:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+
+    store = SeriesStore(df)
+    keys = select_series(store, ids)
+
+    chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    done = set(os.listdir(os.path.join(out_dir, "_done")))
+    pending = [(chunk_id, chunk) for chunk_id, chunk in enumerate(chunks)
+               if f"chunk-{chunk_id:05d}" not in done]
+
+    print(f"{len(keys)} séries em {len(chunks)} lotes; {len(chunks) - len(pending)} já concluídos.")
+
+    n_workers = n_workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    n_series = 0
+    n_errors = 0
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        in_flight = set()
+        queue = iter(pending)
+
+        # No máximo 2 lotes por processo em voo: a memória não cresce com o total de séries
+        while True:
+            for chunk_id, chunk in queue:
+                items = [(key, *store.get(*key)) for key in chunk]
+                in_flight.add(executor.submit(run_chunk, chunk_id, items, model_names, out_dir,
+                                              train_end, val_start, val_end, cache_dir, future_years))
+                if len(in_flight) >= 2 * n_workers:
+                    break
+            if not in_flight:
+                break
+
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                chunk_id, count, errors = future.result()
+                n_series += count
+                n_errors += errors
+                print(f"Lote {chunk_id + 1}/{len(chunks)} concluído ({count} séries, {errors} erros)")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{n_series} séries processadas em {elapsed:.1f}s; resultados em {out_dir}")
+
+    return {"series": n_series, "errors": n_errors, "seconds": elapsed}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Previsão em lote de desmatamento por município e bioma.")
+    parser.add_argument("--processed", required=True, help="Base processada (diretório Parquet ou .csv)")
+    parser.add_argument("--out", required=True, help="Diretório de saída particionado por bioma")
+    parser.add_argument("--series", default="all",
+                        help="'all' ou lista de id_municipio separados por vírgula")
+    parser.add_argument("--bioma", action="append", help="Filtra por bioma (pode repetir)")
+    parser.add_argument("--models", default=",".join(available_models()),
+                        help=f"Modelos separados por vírgula ({', '.join(available_models())})")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--train-end", type=int, default=None,
+                        help="Padrão: 3 anos antes do fim da validação")
+    parser.add_argument("--val-start", type=int, default=None, help="Padrão: ano seguinte ao fim do treino")
+    parser.add_argument("--val-end", type=int, default=None, help="Padrão: último ano da base")
+    parser.add_argument("--horizon", type=int, default=5, help="Anos previstos após o fim da validação")
+    parser.add_argument("--cache-dir", default=None, help="Diretório do cache de previsões (opcional)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    ids = None if args.series == "all" else [int(x) for x in args.series.split(",") if x.strip()]
+
+    run_batch(
+        args.processed,
+        args.out,
+        ids=ids,
+        biomas=args.bioma,
+        model_names=[m.strip() for m in args.models.split(",") if m.strip()],
+        n_workers=args.workers,
+        chunk_size=args.chunk_size,
+        train_end=args.train_end,
+        val_start=args.val_start,
+        val_end=args.val_end,
+        cache_dir=args.cache_dir,
+        horizon=args.horizon,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import N_MUNICIPIOS, generate_prodes, generate_centroids
+from pre_processing.pre_processing import preprocess_and_save
+from splitter.train_val_split import get_municipio_df, split_series
+from splitter.series_store import SeriesStore
+from model import (
+    predict_variance,
+    predict_moving_average,
+    predict_linear_regression,
+    predict_random_forest,
+    predict_arima,
+    predict_variance_batch,
+    predict_moving_average_batch,
+    predict_linear_regression_batch,
+)
+from evaluation.model_evaluator import ModelEvaluator
+from evaluation.metrics import evaluate_batch
+
+
+def measure(fn, memory=True):
+    # Tempo numa execução limpa; pico de memória (tracemalloc) numa segunda execução
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    wall = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return wall, peak
+
+
+def _sample_keys(store, n, seed=0):
+    keys = list(store.keys())
+    rng = np.random.default_rng(seed)
+    idx = rng.choice(len(keys), size=min(n, len(keys)), replace=False)
+    return [keys[i] for i in sorted(idx)]
+
+
+def build_stages(df, work_dir, n_sample):
+    store = SeriesStore(df)
+    sample = _sample_keys(store, n_sample)
+    splits = [split_series(get_municipio_df(m, b, df)) for m, b in sample]
+
+    raw_path = os.path.join(work_dir, "raw.csv")
+    df.sample(frac=1.0, random_state=0).to_csv(raw_path, index=False)
+    centroids_path = os.path.join(work_dir, "centroides.csv")
+    generate_centroids(df).to_csv(centroids_path, index=False)
+
+    def store_run():
+        index = SeriesStore(df)
+        for m, b in sample:
+            index.get(m, b)
+
+    def evaluator_run():
+        for split in splits:
+            series_df = pd.DataFrame({"ano": split.years, "desmatado": split.values})
+            evaluator = ModelEvaluator(series_df)
+            evaluator.add_model_prediction("Regressão Linear",
+                                           predict_linear_regression(split)["validation_predictions"])
+            evaluator.add_model_prediction("Janela de Média(3)",
+                                           predict_moving_average(split)["validation_predictions"])
+            evaluator.generate_comparison_table()
+
+    def batch_metrics_run():
+        frames = {
+            "Variância": predict_variance_batch(df)[1],
+            "Janela de Média(3)": predict_moving_average_batch(df)[1],
+            "Regressão Linear": predict_linear_regression_batch(df)[1],
+        }
+        evaluate_batch(df, frames)
+
+    def heatmap_run():
+        from mapa_calor import criar_mapa_calor
+        criar_mapa_calor(df, centroids_path, out_path=os.path.join(work_dir, "mapa.html"))
+
+    per_series = {
+        "predict_variance": predict_variance,
+        "predict_moving_average": predict_moving_average,
+        "predict_linear_regression": predict_linear_regression,
+        "predict_random_forest": predict_random_forest,
+        "predict_arima": predict_arima,
+    }
+
+    # (nome, função, itens processados); itens = séries da amostra ou linhas da tabela
+    stages = [
+        ("preprocess_and_save", lambda: preprocess_and_save(raw_path, os.path.join(work_dir, "store")), len(df)),
+        ("get_municipio_df", lambda: [get_municipio_df(m, b, df) for m, b in sample], len(sample)),
+        ("series_store_lookup", store_run, len(sample)),
+    ]
+    for name, predictor in per_series.items():
+        stages.append((name, lambda p=predictor: [p(split) for split in splits], len(splits)))
+    stages += [
+        ("predict_variance_batch", lambda: predict_variance_batch(df), len(store)),
+        ("predict_moving_average_batch", lambda: predict_moving_average_batch(df), len(store)),
+        ("predict_linear_regression_batch", lambda: predict_linear_regression_batch(df), len(store)),
+        ("model_evaluator", evaluator_run, len(splits)),
+        ("evaluate_batch", batch_metrics_run, len(store)),
+        ("criar_mapa_calor", heatmap_run, len(df)),
+    ]
+    return stages
+
+
+def run(scales, n_sample=20, memory=True, stages_filter=None, seed=0):
+    warnings.filterwarnings("ignore")
+    results = []
+
+    for scale in scales:
+        n_mun = max(1, int(round(N_MUNICIPIOS * scale)))
+        df = generate_prodes(n_municipios=n_mun, seed=seed)
+        print(f"\nEscala {scale}: {n_mun} municípios, {len(df)} linhas")
+
+        with tempfile.TemporaryDirectory(prefix="bench_prodes_") as work_dir:
+            for name, fn, n_items in build_stages(df, work_dir, n_sample):
+                if stages_filter and name not in stages_filter:
+                    continue
+                record = {"stage": name, "scale": scale, "n_municipios": n_mun, "n_rows": len(df),
+                          "n_items": n_items}
+                try:
+                    wall, peak = measure(fn, memory)
+                    record.update({
+                        "wall_s": wall,
+                        "per_item_ms": wall / n_items * 1000 if n_items else None,
+                        "peak_mb": peak / 1024 ** 2 if peak is not None else None,
+                    })
+                    peak_txt = f", pico {record['peak_mb']:.1f} MB" if peak is not None else ""
+                    print(f"  {name:<34} {wall:8.3f}s{peak_txt}")
+                except ImportError as e:
+                    record["skipped"] = f"dependência ausente: {e}"
+                    print(f"  {name:<34} ignorado ({e})")
+                results.append(record)
+
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline em dados sintéticos no formato PRODES.")
+    parser.add_argument("--scales", default="0.01,0.05,0.2",
+                        help="Frações dos ~5.570 municípios, separadas por vírgula")
+    parser.add_argument("--sample", type=int, default=20, help="Séries usadas nas etapas por série")
+    parser.add_argument("--stages", default=None, help="Etapas a executar, separadas por vírgula")
+    parser.add_argument("--no-memory", action="store_true", help="Não mede o pico de memória")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    scales = [float(s) for s in args.scales.split(",")]
+    stages_filter = set(args.stages.split(",")) if args.stages else None
+    results = run(scales, args.sample, not args.no_memory, stages_filter, args.seed)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "seed": args.seed,
+            "sample": args.sample,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
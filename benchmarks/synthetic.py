@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+BIOMAS = ["Amazônia", "Caatinga", "Cerrado", "Mata Atlântica", "Pampa", "Pantanal"]
+UFS = [11, 12, 13, 14, 15, 16, 17, 21, 22, 23, 24, 25, 26, 27, 28, 29, 31, 32, 33, 35, 41, 42, 43, 50, 51, 52, 53]
+N_MUNICIPIOS = 5570
+
+
+def generate_prodes(n_municipios: int = N_MUNICIPIOS, biomas=None, anos=range(2000, 2024),
+                    seed: int = 0) -> pd.DataFrame:
+    # Mesmo esquema da base processada, já ordenada por bioma, id_municipio e ano
+    rng = np.random.default_rng(seed)
+    biomas = BIOMAS if biomas is None else list(biomas)
+    anos = np.asarray(list(anos), dtype=np.int64)
+
+    uf = np.sort(rng.choice(UFS, size=n_municipios))
+    _, first = np.unique(uf, return_index=True)
+    seq = np.arange(n_municipios) - np.repeat(first, np.diff(np.append(first, n_municipios)))
+    ids = uf * 100000 + seq * 10 + 1
+
+    n_series = n_municipios * len(biomas)
+    n_anos = len(anos)
+
+    area_total = rng.lognormal(6.0, 1.0, n_series)
+    base = area_total * rng.uniform(0.01, 0.3, n_series)
+    trend = rng.normal(0.0, 0.01, n_series) * base
+    noise = rng.normal(0.0, 0.05, (n_series, n_anos)) * base[:, None]
+    desmatado = np.clip(base[:, None] + trend[:, None] * np.arange(n_anos)[None, :] + noise, 0.0, None)
+    desmatado = np.maximum.accumulate(desmatado, axis=1)
+
+    vegetacao = np.clip(area_total[:, None] - desmatado, 0.0, None)
+    hidrografia = np.repeat((area_total * rng.uniform(0.0, 0.05, n_series))[:, None], n_anos, axis=1)
+
+    df = pd.DataFrame({
+        "id_municipio": np.tile(np.repeat(ids, n_anos), len(biomas)),
+        "bioma": np.repeat(biomas, n_municipios * n_anos),
+        "ano": np.tile(anos, n_series),
+        "area_total": np.repeat(area_total, n_anos),
+        "desmatado": desmatado.ravel(),
+        "vegetacao_natural": vegetacao.ravel(),
+        "nao_vegetacao_natural": (area_total[:, None] * 0.02).repeat(n_anos, axis=1).ravel(),
+        "hidrografia": hidrografia.ravel(),
+    })
+
+    return df.sort_values(["bioma", "id_municipio", "ano"]).reset_index(drop=True)
+
+
+def generate_centroids(df: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ids = np.unique(df["id_municipio"].to_numpy())
+    return pd.DataFrame({
+        "code_muni": ids,
+        "latitude": rng.uniform(-33.0, 5.0, len(ids)).astype(np.float32),
+        "longitude": rng.uniform(-73.0, -35.0, len(ids)).astype(np.float32),
+    })
@@ -0,0 +1,174 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import lsqr
+
+from evaluation.metrics import METRIC_NAMES, prediction_cube
+from evaluation.model_evaluator import ModelEvaluator
+from splitter.train_val_split import SeriesMatrix, SeriesSplit, build_series_matrix
+
+NATIONAL = "Brasil"
+
+
+def build_summing_matrix(keys):
+    # Linhas: total nacional, um total por bioma e as séries (id_municipio, bioma) na ordem de `keys`
+    biomas = np.array([str(b) for _, b in keys], dtype=object)
+    bioma_names = sorted(set(biomas))
+    n = len(keys)
+
+    national = sparse.csr_matrix(np.ones((1, n)))
+    bioma_codes = np.searchsorted(np.array(bioma_names, dtype=object), biomas)
+    by_bioma = sparse.csr_matrix((np.ones(n), (bioma_codes, np.arange(n))), shape=(len(bioma_names), n))
+    S = sparse.vstack([national, by_bioma, sparse.identity(n, format="csr")], format="csr")
+
+    nodes = pd.DataFrame({
+        "nivel": [NATIONAL] + ["bioma"] * len(bioma_names) + ["municipio"] * n,
+        "bioma": [None] + bioma_names + list(biomas),
+        "id_municipio": pd.array([None] * (1 + len(bioma_names)) + [int(m) for m, _ in keys], dtype="Int64"),
+    })
+    return S, nodes
+
+
+def aggregate(S, bottom):
+    # Um único produto esparso; anos sem nenhuma série presente ficam NaN no agregado
+    bottom = np.asarray(bottom, dtype=np.float64)
+    present = S @ (~np.isnan(bottom)).astype(np.float64)
+    totals = S @ np.nan_to_num(bottom, nan=0.0)
+    return np.where(present > 0, totals, np.nan)
+
+
+def reconcile_ols(S, base):
+    # Projeção OLS: b = argmin ||S b - base||, previsão coerente = S b. Séries sem previsão no ano saem de S
+    # junto com os totais que ficariam sem filhas; anos sem base completa caem na soma de baixo para cima.
+    base = np.asarray(base, dtype=np.float64)
+    n_aggregates = S.shape[0] - S.shape[1]
+    reconciled = np.full(base.shape, np.nan)
+    fallback = []
+
+    for t in range(base.shape[1]):
+        present = ~np.isnan(base[n_aggregates:, t])
+        if not present.any():
+            continue
+
+        S_t = S[:, present]
+        rows = np.flatnonzero(S_t.getnnz(axis=1) > 0)
+        column = base[rows, t]
+        if np.isnan(column).any():
+            reconciled[:, t] = aggregate(S, base[n_aggregates:, t:t + 1])[:, 0]
+            fallback.append(t)
+            continue
+
+        S_t = S_t[rows]
+        bottom = lsqr(S_t, column, atol=1e-12, btol=1e-12)[0]
+        reconciled[rows, t] = S_t @ bottom
+
+    return reconciled, fallback
+
+
+def _aggregate_base_forecasts(model, years, truth_totals, train_end, val_start, val_end, future_years):
+    from model.registry import get_model
+
+    predictor = get_model(model)
+    base = np.full(truth_totals.shape, np.nan)
+    col = {year: j for j, year in enumerate(years)}
+
+    for i, row in enumerate(truth_totals):
+        observed = ~np.isnan(row)
+        try:
+            split = SeriesSplit(years[observed], row[observed], train_end=train_end, val_start=val_start,
+                                val_end=val_end, future_years=future_years)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                result = predictor(split)
+        except Exception:
+            continue
+        for year, pred in list(result["validation_predictions"].items()) + list(zip(result["pred_years"],
+                                                                                   result["predictions"])):
+            if int(year) in col:
+                base[i, col[int(year)]] = pred
+
+    return base
+
+
+def hierarchical_forecasts(df, frames, train_end=2020, val_start=2021, val_end=2023, future_years=None,
+                           reconcile=False):
+    # frames: {modelo: DataFrame longo de batch_results_frame}; com reconcile=True, modelos cujo nome está
+    # no registro ganham previsões próprias nos totais, combinadas às municipais por OLS
+    if future_years is None:
+        future_years = list(range(val_end + 1, val_end + 6))
+
+    matrix = build_series_matrix(df)
+    years = np.union1d(matrix.years, np.asarray(future_years, dtype=np.int64))
+    truth_bottom = np.full((len(matrix.keys), len(years)), np.nan)
+    truth_bottom[:, np.searchsorted(years, matrix.years)] = matrix.values
+
+    S, nodes = build_summing_matrix(matrix.keys)
+    truth = aggregate(S, truth_bottom)
+    n_aggregates = S.shape[0] - len(matrix.keys)
+
+    extended = SeriesMatrix(matrix.keys, years, truth_bottom)
+    validation = prediction_cube(frames, extended, kind="validacao")
+    future = prediction_cube(frames, extended, kind="previsao")
+    bottom = np.where(np.isnan(validation), future, validation)
+
+    forecasts = {}
+    for m, model in enumerate(frames):
+        coherent = aggregate(S, bottom[:, m, :])
+        if reconcile:
+            from model.registry import MODEL_REGISTRY
+
+            if model in MODEL_REGISTRY:
+                base = coherent.copy()
+                base[:n_aggregates] = _aggregate_base_forecasts(model, years, truth[:n_aggregates], train_end,
+                                                                val_start, val_end, future_years)
+                coherent, fallback = reconcile_ols(S, base)
+                if fallback:
+                    print(f"{model}: anos sem previsão própria nos totais, mantidos como soma das séries: "
+                          f"{[int(years[t]) for t in fallback]}")
+        forecasts[model] = coherent
+
+    return nodes, years, truth, forecasts
+
+
+def hierarchy_frame(nodes, years, truth, forecasts, val_start=2021, val_end=2023, levels=(NATIONAL, "bioma")):
+    keep = nodes["nivel"].isin(levels).to_numpy()
+    parts = []
+    for model, values in forecasts.items():
+        rows, cols = np.nonzero(keep[:, None] & ~np.isnan(values))
+        part = nodes.iloc[rows].reset_index(drop=True)
+        part.insert(0, "Modelo", model)
+        part["ano"] = years[cols]
+        part["tipo"] = np.where((years[cols] >= val_start) & (years[cols] <= val_end), "validacao", "previsao")
+        part["previsto"] = values[rows, cols]
+        part["real"] = truth[rows, cols]
+        parts.append(part[(part["ano"] >= val_start)])
+
+    return pd.concat(parts, ignore_index=True)
+
+
+def evaluate_hierarchy(nodes, years, truth, forecasts, train_end=2020, val_start=2021, val_end=2023,
+                       levels=(NATIONAL, "bioma")):
+    # Os totais são poucos: cada um passa pelo ModelEvaluator como uma série comum
+    rows = []
+    for i in np.nonzero(nodes["nivel"].isin(levels).to_numpy())[0]:
+        observed = ~np.isnan(truth[i])
+        df_node = pd.DataFrame({"ano": years[observed], "desmatado": truth[i][observed]})
+        evaluator = ModelEvaluator(df_node, train_end=train_end, val_start=val_start, val_end=val_end)
+        for model, values in forecasts.items():
+            evaluator.add_model_prediction(model, dict(zip(years.tolist(), values[i])))
+
+        true_values = evaluator.get_validation_data()
+        for model, pred_dict in evaluator.predictions.items():
+            preds = np.array([pred_dict.get(year, np.nan) for year in true_values.index], dtype=np.float64)
+            valid = ~np.isnan(preds)
+            metrics = evaluator.calculate_metrics(true_values.to_numpy()[valid], preds[valid])
+            rows.append({
+                "nivel": nodes.at[i, "nivel"],
+                "bioma": nodes.at[i, "bioma"],
+                "Modelo": model,
+                **{name: metrics.get(name, np.nan) for name in METRIC_NAMES}
+            })
+
+    return pd.DataFrame(rows, columns=["nivel", "bioma", "Modelo"] + METRIC_NAMES)
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+from splitter.train_val_split import build_series_matrix
+
+METRIC_NAMES = ["RMSE", "MAE", "Bias", "MAPE", "R²"]
+
+
+def compute_metrics_cube(truth, preds, mask=None):
+    # truth: (séries × anos); preds: (séries × modelos × anos); mask marca os anos reais válidos
+    truth = np.asarray(truth, dtype=np.float64)
+    preds = np.asarray(preds, dtype=np.float64)
+    if mask is None:
+        mask = ~np.isnan(truth)
+
+    t = truth[:, None, :]
+    valid = mask[:, None, :] & ~np.isnan(t) & ~np.isnan(preds)
+    n = valid.sum(axis=2)
+    enough = n >= 2
+    n_safe = np.where(enough, n, 1)
+
+    err = np.where(valid, preds - t, 0.0)
+    rmse = np.sqrt((err ** 2).sum(axis=2) / n_safe)
+    mae = np.abs(err).sum(axis=2) / n_safe
+    bias = err.sum(axis=2) / n_safe
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ape = np.where(valid, np.abs(err / t), 0.0)
+        mape = ape.sum(axis=2) / n_safe * 100
+
+        t_mean = np.where(valid, t, 0.0).sum(axis=2) / n_safe
+        ss_tot = np.where(valid, (t - t_mean[:, :, None]) ** 2, 0.0).sum(axis=2)
+        ss_res = (err ** 2).sum(axis=2)
+        r2 = 1 - ss_res / ss_tot
+
+    r2 = np.where((ss_tot < 1e-10) | (r2 < -10), np.nan, r2)
+
+    metrics = {"RMSE": rmse, "MAE": mae, "Bias": bias, "MAPE": mape, "R²": r2}
+    return {name: np.where(enough, values, np.nan) for name, values in metrics.items()}
+
+
+def prediction_cube(frames, matrix, kind="validacao"):
+    # frames: {nome do modelo: DataFrame longo no formato de batch_results_frame}
+    row_index = pd.MultiIndex.from_tuples(matrix.keys, names=["id_municipio", "bioma"])
+    col_index = pd.Index(matrix.years)
+    cube = np.full((len(matrix.keys), len(frames), len(matrix.years)), np.nan)
+
+    for m, frame in enumerate(frames.values()):
+        part = frame[frame["tipo"] == kind]
+        rows = row_index.get_indexer(pd.MultiIndex.from_arrays(
+            [part["id_municipio"].astype(np.int64), part["bioma"].astype(str)]))
+        cols = col_index.get_indexer(part["ano"])
+        ok = (rows >= 0) & (cols >= 0)
+        cube[rows[ok], m, cols[ok]] = part["previsto"].to_numpy(dtype=np.float64)[ok]
+
+    return cube
+
+
+def metrics_frame(keys, model_names, metrics):
+    n_series, n_models = metrics["RMSE"].shape
+    keys_arr = np.array(keys, dtype=object).reshape(-1, 2)
+
+    df = pd.DataFrame({
+        "id_municipio": np.repeat(keys_arr[:, 0].astype(np.int64), n_models),
+        "bioma": np.repeat(keys_arr[:, 1], n_models),
+        "Modelo": np.tile(np.asarray(model_names, dtype=object), n_series),
+    })
+    for name in METRIC_NAMES:
+        df[name] = metrics[name].ravel()
+
+    return df
+
+
+def leaderboard(df_metrics, metric="RMSE"):
+    ranked = df_metrics.dropna(subset=[metric])
+
+    best_idx = ranked.groupby(["id_municipio", "bioma"], sort=True)[metric].idxmin()
+    por_serie = ranked.loc[best_idx, ["id_municipio", "bioma", "Modelo", metric]].reset_index(drop=True)
+
+    vitorias = por_serie.groupby(["bioma", "Modelo"]).size().rename("Vitórias")
+    media = ranked.groupby(["bioma", "Modelo"])[metric].mean().rename(f"{metric} médio")
+    por_bioma = pd.concat([media, vitorias], axis=1).fillna({"Vitórias": 0}).astype({"Vitórias": int}).reset_index()
+    por_bioma = (
+        por_bioma.sort_values(["bioma", f"{metric} médio"])
+        .groupby("bioma", sort=True)
+        .head(1)
+        .reset_index(drop=True)
+    )
+
+    geral = pd.concat([
+        ranked.groupby("Modelo")[metric].mean().rename(f"{metric} médio"),
+        por_serie.groupby("Modelo").size().rename("Vitórias"),
+    ], axis=1).fillna({"Vitórias": 0}).astype({"Vitórias": int}).sort_values(f"{metric} médio").reset_index()
+
+    return {"serie": por_serie, "bioma": por_bioma, "geral": geral}
+
+
+def evaluate_batch(df, frames, val_start=2021, val_end=2023, metric="RMSE"):
+    matrix = build_series_matrix(df)
+    mask = matrix.window_mask(start=val_start, end=val_end)
+
+    cube = prediction_cube(frames, matrix)
+    metrics = compute_metrics_cube(matrix.values, cube, mask)
+    df_metrics = metrics_frame(matrix.keys, list(frames.keys()), metrics)
+
+    return df_metrics, leaderboard(df_metrics, metric)
@@ -1,19 +1,69 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import warnings
+from evaluation.metrics import METRIC_NAMES, compute_metrics_cube
+from evaluation.profiling import make_profiler
+from model.incremental import new_incremental_state
+from model.registry import model_label
+from splitter.train_val_split import SeriesSplit
+from splitter.series_store import SeriesStore
 
 warnings.filterwarnings('ignore')
 
+def draw_comparison(ax, years, values, predictions, train_end=2020, val_start=2021, val_end=2023, title=None):
+    years = np.asarray(years)
+    values = np.asarray(values)
+    # Rótulos acompanham as janelas e os anos realmente presentes na série
+    span = f'{int(years.min())}-{int(years.max())}' if len(years) else f'até {val_end}'
+    ax.plot(years, values, 'ko-',
+            label=f'Dados Históricos ({span})', linewidth=2, markersize=4, alpha=0.8)
+
+    validation_mask = (years >= val_start) & (years <= val_end)
+    ax.plot(years[validation_mask], values[validation_mask], 'ro-',
+            label=f'Valores Reais (Validação {val_start}-{val_end})', linewidth=3, markersize=8,
+            markerfacecolor='red')
+
+    colors = ['blue', 'green', 'orange', 'purple', 'brown', 'pink', 'gray']
+    markers = ['s', 'D', '^', 'v', '<', '>', 'o']
+
+    for i, (model_name, pred_dict) in enumerate(predictions.items()):
+        if pred_dict:
+            pred_years = sorted(pred_dict.keys())
+            pred_values = [pred_dict[year] for year in pred_years]
+            ax.plot(pred_years, pred_values,
+                    marker=markers[i % len(markers)], linestyle='--',
+                    color=colors[i % len(colors)],
+                    label=f'{model_name} (Previsto)',
+                    markersize=8, linewidth=2, alpha=0.8)
+
+    ax.axvline(x=train_end, color='gray', linestyle=':', alpha=0.7,
+               label=f'Fim do Treino ({train_end})')
+    ax.axvline(x=val_start, color='red', linestyle=':', alpha=0.5,
+               label=f'Início Validação ({val_start})')
+
+    ax.set_xlabel('Ano', fontsize=12)
+    ax.set_ylabel('Área Desmatada (km²)', fontsize=12)
+    ax.set_title(title or f'Comparação de Modelos: Previsões vs Realidade ({span})', fontsize=14, fontweight='bold')
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    ax.grid(True, alpha=0.3)
+
+
+BACKTEST_MODELS = ["variance", "moving_average", "linear_regression", "random_forest", "arima"]
+
+
 class ModelEvaluator:
-    def __init__(self, df_filtrado, train_end=2020, val_start=2021, val_end=2023):
+    def __init__(self, df_filtrado, train_end=2020, val_start=2021, val_end=2023, profile=False):
         self.df_filtrado = df_filtrado.sort_values("ano")
         self.train_end = train_end
         self.val_start = val_start
         self.val_end = val_end
         self.true_values = None
         self.predictions = {}
+        self.profiler = make_profiler(profile)
+
+    @property
+    def profile(self):
+        return self.profiler.as_dict()
 
     def get_validation_data(self):
         val_mask = (self.df_filtrado["ano"] >= self.val_start) & (self.df_filtrado["ano"] <= self.val_end)
@@ -31,45 +81,14 @@ class ModelEvaluator:
         if len(true_vals) == 0 or len(pred_vals) == 0:
             return {}
 
-        mask = ~np.isnan(pred_vals)
-        if np.sum(mask) < 2:
-            return {}
-
-        true_filtered = true_vals[mask]
-        pred_filtered = pred_vals[mask]
-
-        rmse = np.sqrt(mean_squared_error(true_filtered, pred_filtered))
-        mae = mean_absolute_error(true_filtered, pred_filtered)
-
-        with np.errstate(divide='ignore', invalid='ignore'):
-            mape = np.mean(np.abs((true_filtered - pred_filtered) / true_filtered)) * 100
-            mape = np.nan if np.isnan(mape) else mape
-
-        bias = np.mean(pred_filtered - true_filtered)
+        true_vals = np.asarray(true_vals, dtype=np.float64)
+        pred_vals = np.asarray(pred_vals, dtype=np.float64)
 
-        ss_res = np.sum((true_filtered - pred_filtered) ** 2)
-        ss_tot = np.sum((true_filtered - np.mean(true_filtered)) ** 2)
-
-        if ss_tot < 1e-10 or len(true_filtered) < 2:
-            r_squared = None
-        else:
-            r_squared = 1 - (ss_res / ss_tot)
-            if r_squared < -10:
-                r_squared = None
-
-        metrics = {
-            "RMSE": rmse,
-            "MAE": mae,
-            "Bias": bias
-        }
-
-        if mape is not None and not np.isnan(mape):
-            metrics["MAPE"] = mape
-
-        if r_squared is not None:
-            metrics["R²"] = r_squared
+        cube = compute_metrics_cube(true_vals[None, :], pred_vals[None, None, :])
+        if np.isnan(cube["RMSE"][0, 0]):
+            return {}
 
-        return metrics
+        return {name: float(cube[name][0, 0]) for name in METRIC_NAMES if not np.isnan(cube[name][0, 0])}
 
     def generate_comparison_table(self):
         if self.true_values is None:
@@ -87,13 +106,14 @@ class ModelEvaluator:
             pred_array = [pred_dict.get(year, np.nan) for year in val_years]
             comparison_data[model_name] = pred_array
 
-            valid_mask = ~np.isnan(pred_array)
-            if np.sum(valid_mask) > 0:
-                true_valid = true_array[valid_mask]
-                pred_valid = np.array(pred_array)[valid_mask]
-                metrics = self.calculate_metrics(true_valid, pred_valid)
-            else:
-                metrics = {}
+            with self.profiler.stage(f"{model_name}:metricas"):
+                valid_mask = ~np.isnan(pred_array)
+                if np.sum(valid_mask) > 0:
+                    true_valid = true_array[valid_mask]
+                    pred_valid = np.array(pred_array)[valid_mask]
+                    metrics = self.calculate_metrics(true_valid, pred_valid)
+                else:
+                    metrics = {}
 
             results.append({
                 "Modelo": model_name,
@@ -115,51 +135,26 @@ class ModelEvaluator:
 
         return df_comparison, df_metrics
 
-    def plot_comparison(self, save_path=None):
+    def plot_comparison(self, save_path=None, show=True, dpi=300):
+        import matplotlib.pyplot as plt
+
         if self.true_values is None:
             self.get_validation_data()
 
-        plt.figure(figsize=(14, 8))
+        fig, ax = plt.subplots(figsize=(14, 8))
 
-        full_data = self.df_filtrado.set_index("ano")["desmatado"]
-
-        plt.plot(full_data.index, full_data.values, 'ko-',
-                 label='Dados Históricos (2000-2023)', linewidth=2, markersize=4, alpha=0.8)
-
-        validation_data = full_data[full_data.index >= self.val_start]
-        plt.plot(validation_data.index, validation_data.values, 'ro-',
-                 label='Valores Reais (Validação 2021-2023)', linewidth=3, markersize=8, markerfacecolor='red')
-
-        colors = ['blue', 'green', 'orange', 'purple', 'brown', 'pink', 'gray']
-        markers = ['s', 'D', '^', 'v', '<', '>', 'o']
-
-        for i, (model_name, pred_dict) in enumerate(self.predictions.items()):
-            if pred_dict:
-                pred_years = sorted(pred_dict.keys())
-                pred_values = [pred_dict[year] for year in pred_years]
-                plt.plot(pred_years, pred_values,
-                         marker=markers[i % len(markers)], linestyle='--',
-                         color=colors[i % len(colors)],
-                         label=f'{model_name} (Previsto)',
-                         markersize=8, linewidth=2, alpha=0.8)
-
-        plt.axvline(x=self.train_end, color='gray', linestyle=':', alpha=0.7,
-                    label='Fim do Treino (2020)')
-        plt.axvline(x=self.val_start, color='red', linestyle=':', alpha=0.5,
-                    label='Início Validação (2021)')
-
-        plt.xlabel('Ano', fontsize=12)
-        plt.ylabel('Área Desmatada (km²)', fontsize=12)
-        plt.title('Comparação de Modelos: Previsões vs Realidade (2000-2023)', fontsize=14, fontweight='bold')
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
+        draw_comparison(ax, self.df_filtrado["ano"].to_numpy(), self.df_filtrado["desmatado"].to_numpy(),
+                        self.predictions, self.train_end, self.val_start, self.val_end)
+        fig.tight_layout()
 
         if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            fig.savefig(save_path, dpi=dpi, bbox_inches='tight')
             print(f"\nGráfico salvo em: {save_path}")
 
-        plt.show()
+        if show:
+            plt.show()
+        else:
+            plt.close(fig)
 
     def generate_insights(self, df_metrics):
         valid_metrics = df_metrics.dropna(subset=['RMSE'])
@@ -177,4 +172,106 @@ class ModelEvaluator:
         print(f"Melhor modelo (MAE): {best_mae_model['Modelo']} (MAE: {best_mae_model['MAE']:.3f})")
 
         if best_r2_model is not None:
-            print(f"Melhor ajuste (R²): {best_r2_model['Modelo']} (R²: {best_r2_model['R²']:.3f})")
\ No newline at end of file
+            print(f"Melhor ajuste (R²): {best_r2_model['Modelo']} (R²: {best_r2_model['R²']:.3f})")
+
+    def backtest(self, origins=None, horizon=3, models=None, window=3, order=(1, 1, 1)):
+        from model.random_forest import predict_random_forest
+
+        if origins is None:
+            origins = list(range(self.train_end - 4, self.train_end + 1))
+        if models is None:
+            models = BACKTEST_MODELS
+
+        origins = sorted(origins)
+        years = self.df_filtrado["ano"].to_numpy()
+        values = self.df_filtrado["desmatado"].to_numpy(dtype=np.float64)
+
+        # Janela expansiva: cada modelo recebe só as observações novas entre origens
+        states = {}
+        for model in models:
+            if model != "random_forest":
+                states[model] = new_incremental_state(model, window, order)
+
+        rows = []
+        failed = set()
+        seen_until = None
+
+        for origin in origins:
+            new_mask = years <= origin if seen_until is None else (years > seen_until) & (years <= origin)
+            seen_until = origin
+
+            for model, state in states.items():
+                if model in failed:
+                    continue
+                try:
+                    with self.profiler.stage(f"{model}:fit"):
+                        state.update(years[new_mask], values[new_mask])
+                except Exception:
+                    failed.add(model)
+
+            target_mask = (years > origin) & (years <= origin + horizon)
+            if not np.any(years <= origin) or np.sum(target_mask) == 0:
+                continue
+            target_years = years[target_mask]
+            target_values = values[target_mask]
+
+            for model in models:
+                try:
+                    if model == "random_forest":
+                        # Sem forma incremental: reajuste completo a cada origem
+                        split = SeriesSplit(years, values, train_end=origin, val_start=origin + 1,
+                                            val_end=origin + horizon, future_years=[])
+                        with self.profiler.stage(f"{model}:fit"):
+                            pred_dict = predict_random_forest(split, n_jobs=1)["validation_predictions"]
+                        preds = [pred_dict[year] for year in target_years]
+                    elif model in failed:
+                        preds = []
+                    else:
+                        with self.profiler.stage(f"{model}:predict"):
+                            preds = states[model].forecast(target_years)
+                    metrics = self.calculate_metrics(target_values, np.asarray(preds, dtype=np.float64))
+                except Exception:
+                    metrics = {}
+
+                rows.append({
+                    "Origem": origin,
+                    "Modelo": model_label(model, window=window),
+                    "N": len(target_years),
+                    **metrics
+                })
+
+        per_origin = pd.DataFrame(rows)
+        if per_origin.empty:
+            return per_origin, per_origin
+
+        metric_cols = [c for c in METRIC_NAMES if c in per_origin.columns]
+        aggregate = (
+            per_origin.groupby("Modelo", sort=False)[metric_cols]
+            .mean()
+            .join(per_origin.groupby("Modelo", sort=False)["Origem"].count().rename("Origens"))
+            .reset_index()
+        )
+
+        return per_origin, aggregate
+
+
+def backtest_series(df, origins=None, horizon=3, models=None, window=3, order=(1, 1, 1),
+                    train_end=2020):
+    per_origin_parts = []
+    aggregate_parts = []
+
+    for (municipio_id, bioma), ano, desmatado in SeriesStore(df):
+        df_serie = pd.DataFrame({"ano": ano, "desmatado": desmatado})
+        evaluator = ModelEvaluator(df_serie, train_end=train_end)
+        per_origin, aggregate = evaluator.backtest(origins, horizon, models, window, order)
+        if per_origin.empty:
+            continue
+        for part, parts in ((per_origin, per_origin_parts), (aggregate, aggregate_parts)):
+            part.insert(0, "bioma", bioma)
+            part.insert(0, "id_municipio", municipio_id)
+            parts.append(part)
+
+    if not per_origin_parts:
+        raise ValueError("Nenhuma série com dados suficientes para o backtest.")
+
+    return pd.concat(per_origin_parts, ignore_index=True), pd.concat(aggregate_parts, ignore_index=True)
@@ -0,0 +1,99 @@
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+
+class StageProfiler:
+    def __init__(self, enabled: bool = True, memory: bool = True):
+        self.enabled = enabled
+        self.memory = memory
+        self.stages = {}
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return nullcontext()
+        return self._measure(name)
+
+    @contextmanager
+    def _measure(self, name):
+        started_tracing = False
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            peak = None
+            if self.memory:
+                peak = max(tracemalloc.get_traced_memory()[1] - base, 0)
+                if started_tracing:
+                    tracemalloc.stop()
+
+            # Etapas repetidas (ex.: previsão ano a ano) somam tempo e guardam o maior pico
+            entry = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "peak_bytes": None, "calls": 0})
+            entry["wall_s"] += wall
+            entry["cpu_s"] += cpu
+            entry["calls"] += 1
+            if peak is not None:
+                entry["peak_bytes"] = max(entry["peak_bytes"] or 0, peak)
+
+    def as_dict(self) -> dict:
+        return {name: dict(values) for name, values in self.stages.items()}
+
+    def attach(self, result: dict) -> dict:
+        if self.enabled:
+            result["profile"] = self.as_dict()
+        return result
+
+
+def make_profiler(profile) -> StageProfiler:
+    # profile=True mede tempo e memória; profile="time" dispensa o tracemalloc, que é caro
+    return StageProfiler(enabled=bool(profile), memory=profile != "time")
+
+
+def profile_frame(records) -> pd.DataFrame:
+    # records: iterável de (id_municipio, bioma, modelo, resultado com a chave "profile")
+    rows = []
+    for municipio_id, bioma, model_name, result in records:
+        for stage, values in result.get("profile", {}).items():
+            rows.append({"id_municipio": municipio_id, "bioma": bioma, "Modelo": model_name,
+                         "etapa": stage, **values})
+    return pd.DataFrame(rows, columns=["id_municipio", "bioma", "Modelo", "etapa",
+                                       "wall_s", "cpu_s", "peak_bytes", "calls"])
+
+
+def profile_report(records, top: int = 10) -> dict:
+    df = profile_frame(records)
+    if df.empty:
+        raise ValueError("Nenhum resultado com perfil — rode os preditores com profile=True.")
+
+    per_series = df.groupby(["id_municipio", "bioma", "Modelo"], as_index=False).agg(
+        wall_s=("wall_s", "sum"), cpu_s=("cpu_s", "sum"), peak_bytes=("peak_bytes", "max"))
+
+    slowest = per_series.sort_values("wall_s", ascending=False).head(top).reset_index(drop=True)
+
+    percentiles = (
+        per_series.groupby("Modelo")["wall_s"]
+        .quantile([0.5, 0.9, 0.99])
+        .unstack()
+        .rename(columns={0.5: "p50_s", 0.9: "p90_s", 0.99: "p99_s"})
+        .join(per_series.groupby("Modelo")["wall_s"].agg(max_s="max", total_s="sum", series="count"))
+        .sort_values("total_s", ascending=False)
+        .reset_index()
+    )
+
+    by_stage = df.groupby(["Modelo", "etapa"], as_index=False).agg(
+        wall_s=("wall_s", "sum"), cpu_s=("cpu_s", "sum"), peak_bytes=("peak_bytes", "max"))
+    by_stage["fracao"] = by_stage["wall_s"] / by_stage.groupby("Modelo")["wall_s"].transform("sum")
+
+    return {"series_mais_lentas": slowest, "percentis_por_modelo": percentiles, "etapas": by_stage}
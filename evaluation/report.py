@@ -0,0 +1,84 @@
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from evaluation.model_evaluator import draw_comparison
+
+
+def _chart_name(key, fmt):
+    municipio_id, bioma = key
+    safe_bioma = "".join(c if c.isalnum() else "_" for c in str(bioma))
+    return f"{municipio_id}_{safe_bioma}.{fmt}"
+
+
+def _render_chunk(items, out_dir, dpi, fmt, train_end, val_start, val_end):
+    # Figura fora do pyplot: salva direto em arquivo sem trocar o backend de quem chamou (inclusive com
+    # n_workers=1, no próprio processo). Uma única figura por lote, limpa e reaproveitada a cada série
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(14, 8))
+    ax = fig.subplots()
+    rendered = []
+    for key, years, values, predictions in items:
+        ax.clear()
+        draw_comparison(ax, years, values, predictions, train_end, val_start, val_end,
+                        title=f"Município {key[0]} — {key[1]}: Previsões vs Realidade")
+        name = _chart_name(key, fmt)
+        fig.savefig(os.path.join(out_dir, name), dpi=dpi, format=fmt, bbox_inches="tight")
+        rendered.append((key, name))
+
+    return rendered
+
+
+def _write_index(out_dir, rendered):
+    by_bioma = {}
+    for (municipio_id, bioma), name in sorted(rendered, key=lambda r: (str(r[0][1]), r[0][0])):
+        by_bioma.setdefault(bioma, []).append((municipio_id, name))
+
+    parts = ["<!DOCTYPE html>", "<html><head><meta charset='utf-8'>",
+             "<title>Comparação de modelos por município</title></head><body>",
+             f"<h1>Comparação de modelos por município ({len(rendered)} gráficos)</h1>"]
+    for bioma, entries in by_bioma.items():
+        parts.append(f"<h2>{html.escape(str(bioma))} ({len(entries)})</h2><ul>")
+        parts.extend(f"<li><a href='{html.escape(name)}'>{municipio_id}</a></li>" for municipio_id, name in entries)
+        parts.append("</ul>")
+    parts.append("</body></html>")
+
+    index_path = os.path.join(out_dir, "index.html")
+    with open(index_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(parts))
+    return index_path
+
+
+def render_reports(items, out_dir, n_workers=None, dpi=100, fmt="png", chunk_size=50,
+                   train_end=2020, val_start=2021, val_end=2023):
+    # items: iterável de ((id_municipio, bioma), anos, valores, {modelo: {ano: previsão}})
+    os.makedirs(out_dir, exist_ok=True)
+    items = list(items)
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    n_workers = n_workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    rendered = []
+    if n_workers == 1:
+        for chunk in chunks:
+            rendered.extend(_render_chunk(chunk, out_dir, dpi, fmt, train_end, val_start, val_end))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_render_chunk, chunk, out_dir, dpi, fmt, train_end, val_start,
+                                       val_end)
+                       for chunk in chunks]
+            for future in futures:
+                rendered.extend(future.result())
+    elapsed = time.perf_counter() - start
+
+    index_path = _write_index(out_dir, rendered)
+    print(f"{len(rendered)} gráficos em {elapsed:.1f}s ({len(rendered) / elapsed:.1f} gráficos/s); índice: {index_path}")
+
+    return {
+        "charts": len(rendered),
+        "seconds": elapsed,
+        "charts_per_second": len(rendered) / elapsed if elapsed > 0 else float("inf"),
+        "index": index_path,
+    }
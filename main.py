@@ -1,25 +1,17 @@
 import os
-import pandas as pd
-from pre_processing.pre_processing import preprocess_and_save
-from splitter.train_val_split import get_municipio_df
-from model import (
-    predict_variance,
-    predict_moving_average,
-    predict_linear_regression,
-    predict_random_forest,
-    predict_arima,
-)
-from evaluation.model_evaluator import ModelEvaluator
-from mapa_calor import criar_mapa_calor
+from pre_processing.pre_processing import preprocess_and_save, load_processed
+from splitter.train_val_split import get_municipio_df, split_series, split_years_for
+from model.registry import get_model
+from model.cache import ForecastCache, cached_predict
 
 def main():
     raw_path = r"C:\Users\Usuario\PycharmProjects\ProjetoPE\data_raw\br_inpe_prodes_municipio_bioma.csv"
-    processed_path = r"C:\Users\Usuario\PycharmProjects\ProjetoPE\data_processed\br_inpe_prodes_municipio_bioma_processed.csv"
+    processed_path = r"C:\Users\Usuario\PycharmProjects\ProjetoPE\data_processed\br_inpe_prodes_municipio_bioma_processed"
 
     if not os.path.exists(processed_path):
         df, _ = preprocess_and_save(raw_path, processed_path)
     else:
-        df = pd.read_csv(processed_path, encoding="utf-8", low_memory=False)
+        df = load_processed(processed_path, columns=["id_municipio", "bioma", "ano", "desmatado"])
 
     print("\nResumo do conjunto de dados:")
     print(f"Total de linhas: {len(df)}")
@@ -35,15 +27,24 @@ def main():
     print(f"\nEncontradas {len(df_filtrado)} linhas para o município {municipio_id} "
           f"(anos {df_filtrado['ano'].min()}..{df_filtrado['ano'].max()})")
 
-    result_variance = predict_variance(df_filtrado)
-    result_ma = predict_moving_average(df_filtrado, window=3)
-    result_lr = predict_linear_regression(df_filtrado)
-    result_rf = predict_random_forest(df_filtrado)
-    result_arima = predict_arima(df_filtrado)
+    # Janelas acompanham o último ano publicado em vez de ficarem fixas em 2020/2023
+    windows = split_years_for(df["ano"].max())
+    split = split_series(df_filtrado, **windows)
+
+    cache = ForecastCache(".forecast_cache")
+
+    result_variance = cached_predict(get_model("variance"), split, cache)
+    result_ma = cached_predict(get_model("moving_average"), split, cache, window=3)
+    result_lr = cached_predict(get_model("linear_regression"), split, cache)
+    result_rf = cached_predict(get_model("random_forest"), split, cache)
+    result_arima = cached_predict(get_model("arima"), split, cache)
+
+    stats = cache.stats()
+    print(f"Cache de previsões: {stats['hits']} acertos, {stats['misses']} falhas")
 
     results = [result_variance, result_ma, result_lr, result_rf, result_arima]
 
-    print("Previsões para anos futuros (2024-2028): ")
+    print(f"Previsões para anos futuros ({split.future_years[0]}-{split.future_years[-1]}): ")
 
     for r in results:
         print(f"\nMétodo: {r['method']}")
@@ -55,7 +56,11 @@ def main():
         if "note" in r:
             print(f"{r['note']}")
 
-    evaluator = ModelEvaluator(df_filtrado)
+    # matplotlib e folium só são carregados quando o relatório e o mapa são gerados
+    from evaluation.model_evaluator import ModelEvaluator
+
+    evaluator = ModelEvaluator(df_filtrado, train_end=split.train_end, val_start=split.val_start,
+                               val_end=split.val_end)
 
     models_with_validation = [
         ("Variância", result_variance.get("validation_predictions", {})),
@@ -79,7 +84,12 @@ def main():
     except Exception as e:
         print(f"\nErro ao salvar arquivos: {e}")
 
-    criar_mapa_calor(df)
+    try:
+        from mapa_calor import criar_mapa_calor
+
+        criar_mapa_calor(df)
+    except FileNotFoundError as e:
+        print(f"\nMapa de calor não gerado: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,24 +1,64 @@
+import os
+import sys
+import numpy as np
 import pandas as pd
 import folium
-import geobr
-from folium.plugins import HeatMap
+from folium.plugins import HeatMap, HeatMapWithTime
 
-def criar_mapa_calor(df: pd.DataFrame):
-    municipios = geobr.read_municipality(year=2020)
-    municipios = municipios.to_crs(epsg=4326)
+CENTROIDS_PATH = os.path.join("data_processed", "centroides_municipios.csv")
 
-    dados_geo = municipios.merge(df, left_on='code_muni', right_on='id_municipio', how='inner')
+GRADIENT = {
+    0.2: 'yellow',
+    0.4: 'orange',
+    0.6: 'red',
+    0.8: 'darkred',
+    1.0: 'black'
+}
 
-    m = folium.Map(location=[-15.5, -56.1], zoom_start=5, tiles='CartoDB positron')
 
-    ano_filtro = 2023
-    df_ano = dados_geo[dados_geo['ano'] == ano_filtro].copy()
+def build_centroid_table(geometry_path: str, out_path: str = CENTROIDS_PATH) -> pd.DataFrame:
+    # Etapa única e offline: lê as geometrias de um arquivo local (ex.: exportado do geobr)
+    import geopandas as gpd
+
+    municipios = gpd.read_file(geometry_path).to_crs(epsg=4326)
+    centroides = municipios.geometry.centroid
+
+    table = pd.DataFrame({
+        "code_muni": municipios["code_muni"].astype(np.int64).to_numpy(),
+        "latitude": centroides.y.astype(np.float32).to_numpy(),
+        "longitude": centroides.x.astype(np.float32).to_numpy(),
+    }).drop_duplicates("code_muni")
+
+    out_dir = os.path.dirname(out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    table.to_csv(out_path, index=False)
+    print(f"Tabela de centroides salva em: {out_path} ({len(table)} municípios)")
+
+    return table
+
+
+def load_centroids(centroids_path: str = CENTROIDS_PATH) -> pd.DataFrame:
+    if not os.path.exists(centroids_path):
+        raise FileNotFoundError(
+            f"Tabela de centroides não encontrada em {centroids_path} — "
+            f"gere com build_centroid_table(<arquivo de geometrias>)."
+        )
+    return pd.read_csv(centroids_path, dtype={"code_muni": np.int64, "latitude": np.float32,
+                                              "longitude": np.float32})
+
 
-    df_ano['latitude'] = df_ano.geometry.centroid.y
-    df_ano['longitude'] = df_ano.geometry.centroid.x
+def criar_mapa_calor(df: pd.DataFrame, centroids_path: str = CENTROIDS_PATH, ano_filtro: int = 2023,
+                     out_path: str = 'mapa_calor_desmatamento.html'):
+    # Filtra o ano antes do join: só as linhas usadas no mapa encontram os centroides
+    df_ano = df.loc[df['ano'] == ano_filtro, ['id_municipio', 'desmatado']]
+    centroides = load_centroids(centroids_path)
 
+    df_ano = df_ano.merge(centroides, left_on='id_municipio', right_on='code_muni', how='inner')
     df_ano = df_ano.dropna(subset=['latitude', 'longitude', 'desmatado'])
 
+    m = folium.Map(location=[-15.5, -56.1], zoom_start=5, tiles='CartoDB positron')
+
     df_ano['intensidade'] = df_ano['desmatado'] / df_ano['desmatado'].max()
 
     heat_data = df_ano[['latitude', 'longitude', 'intensidade']].values.tolist()
@@ -29,14 +69,66 @@ def criar_mapa_calor(df: pd.DataFrame):
         blur=6,
         min_opacity=0.3,
         max_opacity=0.9,
-        gradient={
-            0.2: 'yellow',
-            0.4: 'orange',
-            0.6: 'red',
-            0.8: 'darkred',
-            1.0: 'black'
-        }
+        gradient=GRADIENT
     ).add_to(m)
 
-    m.save('mapa_calor_desmatamento.html')
-    print("Mapa de calor salvo como 'mapa_calor_desmatamento.html'")
+    m.save(out_path)
+    print(f"Mapa de calor salvo como '{out_path}'")
+
+
+def criar_mapa_calor_temporal(df: pd.DataFrame, centroids_path: str = CENTROIDS_PATH, previsoes: pd.DataFrame = None,
+                              precision: int = 2, min_intensity: float = 0.01, max_points_per_year: int = 5000,
+                              out_path: str = 'mapa_calor_temporal.html'):
+    dados = df[['id_municipio', 'ano', 'desmatado']]
+    anos_observados = set(dados['ano'].unique())
+
+    # Anos previstos entram como camadas extras (ex.: saída do batch.py filtrada para um modelo)
+    if previsoes is not None:
+        futuro = previsoes.loc[~previsoes['ano'].isin(anos_observados), ['id_municipio', 'ano', 'previsto']]
+        dados = pd.concat([dados, futuro.rename(columns={'previsto': 'desmatado'})], ignore_index=True)
+
+    dados = dados[dados['desmatado'] > 0].merge(load_centroids(centroids_path), left_on='id_municipio',
+                                                right_on='code_muni', how='inner')
+
+    # Coordenadas quantizadas: pontos muito próximos viram um só, reduzindo o HTML
+    dados['latitude'] = dados['latitude'].round(precision)
+    dados['longitude'] = dados['longitude'].round(precision)
+
+    pontos = dados.groupby(['ano', 'latitude', 'longitude'], sort=True)['desmatado'].sum().reset_index()
+    pontos['intensidade'] = pontos['desmatado'] / pontos.groupby('ano')['desmatado'].transform('max')
+    pontos = pontos[pontos['intensidade'] >= min_intensity]
+
+    if max_points_per_year is not None:
+        pontos = pontos.sort_values(['ano', 'intensidade'], ascending=[True, False])
+        pontos = pontos.groupby('ano', sort=True).head(max_points_per_year)
+    pontos = pontos.sort_values('ano', kind='stable')
+    pontos['intensidade'] = pontos['intensidade'].round(3)
+
+    anos = pontos['ano'].to_numpy()
+    cortes = np.flatnonzero(np.diff(anos)) + 1
+    valores = pontos[['latitude', 'longitude', 'intensidade']].to_numpy(dtype=np.float64)
+    heat_data = [bloco.tolist() for bloco in np.split(valores, cortes)] if len(valores) else []
+    rotulos = [f"{ano}" if ano in anos_observados else f"{ano} (previsão)"
+               for ano in (anos[np.r_[0, cortes]] if len(anos) else [])]
+
+    m = folium.Map(location=[-15.5, -56.1], zoom_start=5, tiles='CartoDB positron')
+
+    HeatMapWithTime(
+        data=heat_data,
+        index=rotulos,
+        radius=4,
+        min_opacity=0.3,
+        max_opacity=0.9,
+        gradient=GRADIENT,
+        auto_play=False
+    ).add_to(m)
+
+    m.save(out_path)
+    print(f"Mapa de calor temporal salvo como '{out_path}' ({len(rotulos)} anos, {len(pontos)} pontos)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python mapa_calor.py <arquivo de geometrias dos municípios> [saída.csv]")
+        sys.exit(1)
+    build_centroid_table(sys.argv[1], *sys.argv[2:3])
@@ -1,13 +1,52 @@
-from .variance import predict_variance
-from .moving_average import predict_moving_average
-from .linear_regression import predict_linear_regression
-from .random_forest import predict_random_forest
-from .arima import predict_arima
+import importlib
+
+from .registry import MODEL_REGISTRY, available_models, get_model, model_label, model_params
+
+# Exportações carregadas no primeiro acesso (PEP 562), para não importar statsmodels/sklearn à toa
+_LAZY_EXPORTS = {
+    "predict_variance": "variance",
+    "predict_variance_batch": "variance",
+    "predict_moving_average": "moving_average",
+    "predict_moving_average_batch": "moving_average",
+    "predict_linear_regression": "linear_regression",
+    "predict_linear_regression_batch": "linear_regression",
+    "predict_random_forest": "random_forest",
+    "predict_random_forest_batch": "random_forest",
+    "predict_random_forest_global": "random_forest",
+    "predict_arima": "arima",
+    "predict_arima_parallel": "arima",
+    "update_forecasts": "update",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        value = getattr(importlib.import_module(f".{_LAZY_EXPORTS[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_EXPORTS))
+
 
 __all__ = [
     "predict_variance",
+    "predict_variance_batch",
     "predict_moving_average",
+    "predict_moving_average_batch",
     "predict_linear_regression",
+    "predict_linear_regression_batch",
     "predict_random_forest",
-    "predict_arima"
-]
\ No newline at end of file
+    "predict_random_forest_batch",
+    "predict_random_forest_global",
+    "predict_arima",
+    "predict_arima_parallel",
+    "update_forecasts",
+    "MODEL_REGISTRY",
+    "available_models",
+    "get_model",
+    "model_label",
+    "model_params",
+]
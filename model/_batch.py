@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from splitter.train_val_split import build_series_matrix
+
+
+def prepare_batch(df, train_end=2020, val_start=2021, val_end=2023):
+    matrix = build_series_matrix(df)
+    train_mask = matrix.window_mask(end=train_end)
+    val_mask = matrix.window_mask(start=val_start, end=val_end)
+
+    # Séries sem treino ou sem validação seriam rejeitadas por train_val_split
+    keep = train_mask.any(axis=1) & val_mask.any(axis=1)
+    keys = [k for k, ok in zip(matrix.keys, keep) if ok]
+
+    return matrix, keys, matrix.values[keep], train_mask[keep], val_mask[keep]
+
+
+def right_align(values, mask):
+    # Empurra os valores observados de cada linha para a direita, preservando a ordem
+    order = np.argsort(mask, axis=1, kind="stable")
+    packed = np.take_along_axis(np.where(mask, values, np.nan), order, axis=1)
+    return packed, mask.sum(axis=1)
+
+
+def steps_to_val(steps, val_mask):
+    # O k-ésimo ano de validação presente recebe o k-ésimo passo à frente
+    rank = np.clip(np.cumsum(val_mask, axis=1) - 1, 0, None)
+    rank = np.minimum(rank, steps.shape[1] - 1)
+    return np.where(val_mask, np.take_along_axis(steps, rank, axis=1), np.nan)
+
+
+def validation_dict(years, row_preds, row_mask):
+    cols = np.nonzero(row_mask)[0]
+    return dict(zip(years[cols], row_preds[cols].tolist()))
+
+
+def batch_results_frame(method, keys, val_years, val_preds, val_mask, future_years, future_preds,
+                        future_lower=None, future_upper=None):
+    # Formato longo: uma linha por (série, ano), com o tipo de previsão
+    keys_arr = np.array(keys, dtype=object).reshape(-1, 2)
+    future_years = np.asarray(future_years)
+
+    rows_s, cols_y = np.nonzero(val_mask)
+    val_part = pd.DataFrame({
+        "id_municipio": keys_arr[rows_s, 0].astype(np.int64),
+        "bioma": keys_arr[rows_s, 1],
+        "ano": np.asarray(val_years)[cols_y],
+        "tipo": "validacao",
+        "previsto": val_preds[rows_s, cols_y],
+    })
+
+    n_series, horizon = future_preds.shape
+    fut_part = pd.DataFrame({
+        "id_municipio": np.repeat(keys_arr[:, 0].astype(np.int64), horizon),
+        "bioma": np.repeat(keys_arr[:, 1], horizon),
+        "ano": np.tile(future_years, n_series),
+        "tipo": "previsao",
+        "previsto": future_preds.ravel(),
+    })
+    if future_lower is not None:
+        # Intervalos só existem para os anos futuros; nas linhas de validação ficam NaN
+        fut_part["inferior"] = future_lower.ravel()
+        fut_part["superior"] = future_upper.ravel()
+
+    frame = pd.concat([val_part, fut_part], ignore_index=True)
+    frame.insert(0, "method", method)
+    return frame.sort_values(["bioma", "id_municipio", "ano"]).reset_index(drop=True)
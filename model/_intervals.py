@@ -0,0 +1,128 @@
+import warnings
+
+import numpy as np
+
+from ._batch import right_align
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def packed_residuals(residuals, mask):
+    # Resíduos alinhados à direita (NaN à esquerda) e quantos cada série tem
+    packed, n_resid = right_align(residuals, mask & ~np.isnan(residuals))
+    return np.nan_to_num(packed, nan=0.0), n_resid
+
+
+def moving_average_residuals(packed, window):
+    # Erro de um passo da janela de média sobre o treino, com janela parcial no início como no batch
+    valid = ~np.isnan(packed)
+    csum = np.concatenate([np.zeros((len(packed), 1)), np.cumsum(np.nan_to_num(packed), axis=1)], axis=1)
+    ccnt = np.concatenate([np.zeros((len(packed), 1)), np.cumsum(valid, axis=1)], axis=1)
+    j = np.arange(packed.shape[1])
+    lo = np.maximum(j - window, 0)
+    prev_sum = csum[:, j] - csum[:, lo]
+    prev_cnt = ccnt[:, j] - ccnt[:, lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        residuals = packed - prev_sum / prev_cnt
+    return residuals, valid & (prev_cnt > 0)
+
+
+def bootstrap_bounds(residuals, n_resid, simulate, horizon, level=0.9, n_resamples=1000, random_state=42,
+                     max_bytes=DEFAULT_MAX_BYTES, centered=False):
+    # residuals: (séries × R) alinhados à direita; simulate(linhas, ruído) devolve trajetórias
+    # (reamostragens × séries × horizonte). Memória limitada processando as séries em blocos.
+    # centered=True monta a faixa em torno da trajetória sem ruído (a previsão pontual): com ruído quase constante
+    # os quantis das trajetórias colapsam num valor que pode deixar a previsão de fora
+    if residuals.shape[1] == 0:
+        # Nenhum resíduo (ex.: um só ano de treino): trajetórias sem ruído
+        residuals = np.zeros((residuals.shape[0], 1))
+        n_resid = np.zeros(residuals.shape[0], dtype=np.int64)
+    n_series, width = residuals.shape
+    rng = np.random.default_rng(random_state)
+    chunk = max(1, int(max_bytes // (8 * n_resamples * max(horizon, 1) * 3)))
+    alpha = (1 - level) / 2
+
+    lower = np.empty((n_series, horizon))
+    upper = np.empty((n_series, horizon))
+
+    for start in range(0, n_series, chunk):
+        rows = np.arange(start, min(start + chunk, n_series))
+        n = n_resid[rows]
+        offset = width - np.maximum(n, 1)
+        idx = (rng.random((n_resamples, len(rows), horizon)) * np.maximum(n, 1)[None, :, None]).astype(np.int64)
+        noise = residuals[rows[None, :, None], offset[None, :, None] + idx]
+        noise[:, n == 0, :] = 0.0
+
+        paths = simulate(rows, noise)
+        if centered:
+            point = simulate(rows, np.zeros((1, len(rows), horizon)))[0]
+            spread = np.quantile(paths - np.median(paths, axis=0), [alpha, 1 - alpha], axis=0)
+            lower[rows], upper[rows] = point + spread[0], point + spread[1]
+        else:
+            lower[rows], upper[rows] = np.quantile(paths, [alpha, 1 - alpha], axis=0)
+
+    return lower, upper
+
+
+def additive_simulator(point):
+    return lambda rows, noise: point[rows][None, :, :] + noise
+
+
+def drift_simulator(last_value, step):
+    return lambda rows, noise: last_value[rows][None, :, None] + np.cumsum(step[rows][None, :, None] + noise, axis=2)
+
+
+def moving_average_simulator(buffer, width):
+    window = buffer.shape[1]
+    active = np.arange(window)[None, :] >= (window - width)[:, None]
+
+    def simulate(rows, noise):
+        n_resamples, n_rows, horizon = noise.shape
+        mask = active[rows][None, :, :]
+        buf = np.broadcast_to(np.nan_to_num(buffer[rows]), (n_resamples, n_rows, window)).copy()
+        paths = np.empty(noise.shape)
+        for h in range(horizon):
+            paths[:, :, h] = (buf * mask).sum(axis=2) / width[rows][None, :] + noise[:, :, h]
+            buf = np.concatenate([buf[:, :, 1:], paths[:, :, h:h + 1]], axis=2)
+        return paths
+
+    return simulate
+
+
+def moving_average_bounds(packed, n_train, window, horizon, level=0.9, n_resamples=1000, random_state=42):
+    # packed: treino alinhado à direita (séries × anos), como em right_align. Em séries com tendência os erros
+    # de um passo têm todos o mesmo sinal; centrá-los mantém a faixa em torno da previsão pontual
+    residuals, mask = moving_average_residuals(packed, window)
+    residuals = np.where(mask, residuals, np.nan)
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        residuals = residuals - np.nanmean(residuals, axis=1, keepdims=True)
+    residuals, n_resid = packed_residuals(residuals, mask)
+
+    buffer = packed[:, -window:]
+    if buffer.shape[1] < window:
+        buffer = np.pad(buffer, ((0, 0), (window - buffer.shape[1], 0)), constant_values=np.nan)
+    width = np.minimum(n_train, window)
+
+    return bootstrap_bounds(residuals, n_resid, moving_average_simulator(buffer, width), horizon, level,
+                            n_resamples, random_state)
+
+
+def variance_bounds(packed, last_value, step, horizon, level=0.9, n_resamples=1000, random_state=42):
+    # Ruído do passo: variação anual observada em torno da sua média, somado ao passo determinístico do método
+    diffs = np.diff(packed, axis=1)
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        diffs = diffs - np.nanmean(diffs, axis=1, keepdims=True)
+    residuals, n_resid = packed_residuals(diffs, ~np.isnan(diffs))
+
+    return bootstrap_bounds(residuals, n_resid, drift_simulator(last_value, step), horizon, level,
+                            n_resamples, random_state, centered=True)
+
+
+def interval_fields(level, lower, upper):
+    return {
+        "interval_level": level,
+        "lower": [float(v) for v in lower],
+        "upper": [float(v) for v in upper],
+    }
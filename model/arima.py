@@ -1,23 +1,490 @@
+import atexit
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+import numpy as np
+import pandas as pd
 from statsmodels.tsa.arima.model import ARIMA
-from splitter.train_val_split import train_val_split
+from statsmodels.tsa.stattools import kpss
+from splitter.train_val_split import SeriesSplit, split_series
+from splitter.series_store import SeriesStore
+from .moving_average import moving_average_forecast
+from evaluation.profiling import make_profiler
+from .cache import series_hash
+from ._intervals import interval_fields
+
+
+def _fit_forecast(train_series, val_steps, future_steps, order=(1, 1, 1), maxiter=None, profiler=None,
+                  interval=None):
+    profiler = profiler or make_profiler(False)
+
+    with profiler.stage("fit"):
+        model = ARIMA(train_series, order=order)
+        if maxiter is None:
+            model_fit = model.fit()
+        else:
+            model_fit = model.fit(method_kwargs={"maxiter": maxiter})
+
+    with profiler.stage("predict"):
+        val_preds, future_preds = model_fit.forecast(steps=val_steps), model_fit.forecast(steps=future_steps)
+
+    bounds = None
+    if interval is not None:
+        with profiler.stage("intervals"):
+            conf_int = np.asarray(model_fit.get_forecast(steps=future_steps).conf_int(alpha=1 - interval))
+            bounds = (conf_int[:, 0], conf_int[:, 1])
+
+    return val_preds, future_preds, bounds
+
+
+def _aic_for_order(train_series, order, maxiter=50):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            fit = ARIMA(train_series, order=order).fit(method_kwargs={"maxiter": maxiter})
+        aic = float(fit.aic)
+        return order, aic if np.isfinite(aic) else np.inf
+    except Exception:
+        return order, np.inf
+
+
+def _ndiffs(train_series, max_d=2, alpha=0.05):
+    # Diferencia até o teste KPSS não rejeitar estacionariedade
+    series = np.asarray(train_series, dtype=np.float64)
+    for d in range(max_d + 1):
+        if d == max_d or len(series) < 4 or np.allclose(series, series[0]):
+            return d
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                p_value = kpss(series, regression="c", nlags="auto")[1]
+        except Exception:
+            return d
+        if p_value >= alpha:
+            return d
+        series = np.diff(series)
+    return max_d
+
+
+_search_pool = None
+
+
+def _shared_search_pool(n_workers):
+    # Um pool por processo, reaproveitado entre séries: criar um a cada busca custa mais que os ajustes
+    global _search_pool
+    if _search_pool is None or _search_pool._max_workers != n_workers:
+        if _search_pool is not None:
+            _search_pool.shutdown()
+        _search_pool = ProcessPoolExecutor(max_workers=n_workers)
+        atexit.register(_search_pool.shutdown)
+    return _search_pool
+
+
+def _stepwise_orders(d, max_p=3, max_q=3, max_steps=10, tol=1e-3):
+    # Busca stepwise por AIC: parte de modelos simples e só anda para vizinhos (p±1, q±1). Gerador: entrega cada
+    # rodada de ordens e recebe {ordem: aic}, para o chamador decidir onde ajustar (no processo, num pool ou junto
+    # com as buscas de outras séries)
+    def valid(p, q):
+        return 0 <= p <= max_p and 0 <= q <= max_q
+
+    tried = {}
+    tried.update((yield [(p, d, q) for p, q in [(2, 2), (0, 0), (1, 0), (0, 1)] if valid(p, q)]))
+    best = min(tried, key=tried.get)
+
+    for _ in range(max_steps):
+        p, _, q = best
+        neighbours = [(p + dp, d, q + dq) for dp, dq in
+                      [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1), (-1, 1), (1, -1)]
+                      if valid(p + dp, q + dq)]
+        tried.update((yield [o for o in neighbours if o not in tried]))
+        candidate = min(tried, key=tried.get)
+        # Parada antecipada: nenhum vizinho melhora o AIC de forma relevante
+        if not tried[candidate] < tried[best] - tol:
+            break
+        best = candidate
+
+    if not np.isfinite(tried[best]):
+        return (1, 1, 1), np.inf, len(tried)
+
+    return best, tried[best], len(tried)
+
+
+def select_arima_order(train_series, max_p=3, max_d=2, max_q=3, n_workers=1, maxiter=50, max_steps=10,
+                       tol=1e-3, executor=None):
+    train_series = np.asarray(train_series, dtype=np.float64)
+    if executor is None and n_workers and n_workers > 1:
+        executor = _shared_search_pool(n_workers)
+
+    search = _stepwise_orders(_ndiffs(train_series, max_d), max_p, max_q, max_steps, tol)
+    orders = next(search)
+    while True:
+        if executor is None:
+            scored = [_aic_for_order(train_series, o, maxiter) for o in orders]
+        else:
+            scored = executor.map(_aic_for_order, [train_series] * len(orders), orders, [maxiter] * len(orders))
+        try:
+            orders = search.send(dict(scored))
+        except StopIteration as done:
+            return done.value
+
+
+def _aic_chunk(jobs, maxiter, timeout):
+    # Executado nos processos do pool: ajustes candidatos de várias séries, cada um limitado por `timeout`
+    out = []
+    with _alarm_handler(timeout) as use_alarm:
+        for key, train_series, order in jobs:
+            try:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, timeout)
+                out.append((key, *_aic_for_order(train_series, order, maxiter)))
+            except _FitTimeout:
+                out.append((key, order, np.inf))
+            finally:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+    return out
+
+
+def select_arima_orders(trains, executor, max_p=3, max_d=2, max_q=3, maxiter=50, max_steps=10, tol=1e-3,
+                        timeout=None, deadline=None):
+    # trains: {chave: treino}. As buscas avançam juntas, uma rodada por vez, e os ajustes candidatos de todas as
+    # séries dividem o mesmo pool. Séries não concluídas até `deadline` (segundos) ficam fora do resultado.
+    trains = {key: np.asarray(train, dtype=np.float64) for key, train in trains.items()}
+    searches = {key: _stepwise_orders(_ndiffs(train, max_d), max_p, max_q, max_steps, tol)
+                for key, train in trains.items()}
+    pending = {key: next(search) for key, search in searches.items()}
+    n_workers = max(1, executor._max_workers)
+    stop_at = None if deadline is None else time.monotonic() + deadline
+    found = {}
+
+    while pending:
+        jobs = [(key, trains[key], o) for key, orders in pending.items() for o in orders]
+        size = max(1, -(-len(jobs) // (4 * n_workers)))
+        futures = [executor.submit(_aic_chunk, jobs[i:i + size], maxiter, timeout)
+                   for i in range(0, len(jobs), size)]
+        # Candidatos perdidos por falha no processo contam como AIC infinito
+        scores = {key: dict.fromkeys(orders, np.inf) for key, orders in pending.items()}
+        try:
+            remaining = None if stop_at is None else max(0.0, stop_at - time.monotonic())
+            for future in as_completed(futures, timeout=remaining):
+                try:
+                    scored = future.result()
+                except Exception:
+                    continue
+                for key, o, aic in scored:
+                    scores[key][o] = aic
+        except FuturesTimeoutError:
+            break
+
+        for key in list(pending):
+            try:
+                pending[key] = searches[key].send(scores[key])
+            except StopIteration as done:
+                found[key] = done.value
+                del pending[key]
+
+    return found
+
+
+class ArimaOrderCache:
+    def __init__(self, path: str = os.path.join(".forecast_cache", "arima_orders.json")):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def __repr__(self):
+        return f"ArimaOrderCache({self.path!r})"
+
+    @staticmethod
+    def _key(series_key):
+        return "|".join(str(part) for part in series_key) if isinstance(series_key, tuple) else str(series_key)
+
+    def get(self, series_key, train_series):
+        entry = self.entries.get(self._key(series_key))
+        # A ordem só vale enquanto os dados de treino forem os mesmos
+        if entry is None or entry["hash"] != series_hash(train_series):
+            return None
+        return tuple(entry["order"])
+
+    def put(self, series_key, train_series, order, aic=None):
+        self.entries[self._key(series_key)] = {
+            "hash": series_hash(train_series),
+            "order": list(order),
+            "aic": aic if aic is None or np.isfinite(aic) else None,
+        }
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
 
-def predict_arima(df_filtrado, train_end=2020):
-    train_df, val_df, future_years = train_val_split(df_filtrado, train_end=train_end)
 
-    train_series = train_df.sort_values("ano")["desmatado"].values
+def resolve_order(train_series, order="auto", order_cache=None, series_key=None, n_workers=1, **search_kwargs):
+    if order != "auto":
+        return tuple(order)
 
-    model = ARIMA(train_series, order=(1, 1, 1))
-    model_fit = model.fit()
+    cache_key = series_key if series_key is not None else series_hash(train_series)
+    if order_cache is not None:
+        cached = order_cache.get(cache_key, train_series)
+        if cached is not None:
+            return cached
 
-    val_years_count = len(val_df)
-    val_predictions = model_fit.forecast(steps=val_years_count)
-    val_pred_dict = dict(zip(val_df["ano"].values, val_predictions))
+    best, aic, _ = select_arima_order(train_series, n_workers=n_workers, **search_kwargs)
+    if order_cache is not None:
+        order_cache.put(cache_key, train_series, best, aic)
+        order_cache.save()
 
-    future_predictions = model_fit.forecast(steps=len(future_years))
+    return best
 
-    return {
+
+def predict_arima(df_filtrado, train_end=2020, order=(1, 1, 1), profile=False, order_cache=None,
+                  series_key=None, n_workers=1, interval=None, executor=None, maxiter=None, timeout=None,
+                  fallback_window=3):
+    profiler = make_profiler(profile)
+
+    with profiler.stage("split"):
+        split = split_series(df_filtrado, train_end=train_end)
+    future_years = split.future_years
+
+    reason = None
+    if timeout is None:
+        with profiler.stage("order_selection"):
+            order = resolve_order(split.train_values, order, order_cache, series_key, n_workers, executor=executor)
+
+        val_predictions, future_predictions, bounds = _fit_forecast(split.train_values, len(split.val_years),
+                                                                    len(future_years), order, maxiter,
+                                                                    profiler=profiler, interval=interval)
+    else:
+        # Mesmo limite do caminho paralelo: ajuste que estoura o prazo cai na janela de média
+        with profiler.stage("fit"), _alarm_handler(timeout) as use_alarm:
+            _, val_predictions, future_predictions, reason, _, order, bounds = _fit_one(
+                series_key, split.train_values, len(split.val_years), len(future_years), order, maxiter, timeout,
+                fallback_window, interval, use_alarm)
+    if reason is not None and interval is not None:
+        bounds = ([np.nan] * len(future_years), [np.nan] * len(future_years))
+    val_pred_dict = dict(zip(split.val_years, val_predictions))
+
+    result = {
         "method": "ARIMA",
         "pred_years": future_years,
-        "predictions": future_predictions.tolist(),
-        "validation_predictions": val_pred_dict
-    }
\ No newline at end of file
+        "predictions": np.asarray(future_predictions, dtype=np.float64).tolist(),
+        "validation_predictions": val_pred_dict,
+        "order": tuple(order) if order is not None else None
+    }
+    if bounds is not None:
+        result.update(interval_fields(interval, *bounds))
+    if reason is not None:
+        result["fallback"] = reason
+        result["note"] = f"ARIMA substituído por janela de média({fallback_window}): {reason}"
+
+    return profiler.attach(result)
+
+
+class _FitTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise _FitTimeout()
+
+
+def _alarm_available():
+    # SIGALRM só existe em POSIX e o handler só pode ser instalado na thread principal
+    return hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+
+
+@contextmanager
+def _alarm_handler(timeout):
+    # Instala o handler do alarme quando é possível usá-lo e devolve o do chamador ao sair
+    if timeout is None or not _alarm_available():
+        yield False
+        return
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    try:
+        yield True
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _fit_chunk(chunk, maxiter, timeout, fallback_window, interval=None):
+    # Executado nos processos do pool, ou no próprio processo quando o alarme está disponível
+    out = []
+    with _alarm_handler(timeout) as use_alarm:
+        for item in chunk:
+            out.append(_fit_one(*item, maxiter, timeout, fallback_window, interval, use_alarm))
+    return out
+
+
+def _fit_one(key, train_series, val_steps, future_steps, order, maxiter, timeout, fallback_window, interval,
+             use_alarm):
+    start = time.perf_counter()
+    reason = None
+    bounds = None
+    try:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            order = resolve_order(train_series, order, maxiter=maxiter or 50)
+            val_preds, future_preds, bounds = _fit_forecast(train_series, val_steps, future_steps, order,
+                                                            maxiter, interval=interval)
+        val_preds, future_preds = list(val_preds), list(future_preds)
+    except _FitTimeout:
+        reason = "timeout"
+    except Exception as e:
+        reason = f"erro: {type(e).__name__}: {e}"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    if reason is None and timeout is not None and time.perf_counter() - start > timeout:
+        reason = "timeout"
+
+    if reason is not None:
+        val_preds = moving_average_forecast(train_series, val_steps, fallback_window)
+        future_preds = moving_average_forecast(train_series, future_steps, fallback_window)
+        order = None
+        bounds = None
+
+    return key, val_preds, future_preds, reason, time.perf_counter() - start, order, bounds
+
+
+def predict_arima_parallel(df, train_end=2020, order=(1, 1, 1), n_workers=None, chunk_size=32,
+                           timeout=30.0, maxiter=50, fallback_window=3, order_cache=None, interval=None):
+    series = []
+    val_years_by_key = {}
+    future_years = None
+
+    for key, ano, desmatado in SeriesStore(df):
+        try:
+            split = SeriesSplit(ano, desmatado, train_end=train_end)
+        except ValueError:
+            continue
+        future_years = split.future_years
+        val_years_by_key[key] = split.val_years
+
+        # Ordens já escolhidas para dados idênticos dispensam a busca nos processos
+        series_order = order
+        if order == "auto" and order_cache is not None:
+            series_order = order_cache.get(key, split.train_values) or "auto"
+        series.append((key, split.train_values, len(split.val_years), len(future_years), series_order))
+
+    if not series:
+        raise ValueError("Nenhuma série com dados de treino e validação.")
+
+    chunks = [series[i:i + chunk_size] for i in range(0, len(series), chunk_size)]
+    n_workers = n_workers or os.cpu_count() or 1
+    fitted = []
+
+    # Sem SIGALRM (Windows) ou fora da thread principal um ajuste no próprio processo não pode ser interrompido:
+    # usa o pool mesmo com 1 processo
+    if n_workers == 1 and (timeout is None or _alarm_available()):
+        for chunk in chunks:
+            fitted.extend(_fit_chunk(chunk, maxiter, timeout, fallback_window, interval))
+    else:
+        # Prazo global de segurança para plataformas sem SIGALRM ou processos travados
+        deadline = None
+        if timeout is not None:
+            deadline = timeout * (len(series) / n_workers + chunk_size)
+
+        executor = ProcessPoolExecutor(max_workers=n_workers)
+        searching = {item[0]: item[1] for item in series if item[4] == "auto"}
+        if searching:
+            # Buscas de ordem de todas as séries num só pool, antes dos ajustes finais
+            found = select_arima_orders(searching, executor, maxiter=maxiter or 50, timeout=timeout,
+                                        deadline=deadline)
+            chunks = [[(key, train, val_steps, future_steps, found[key][0] if key in found else series_order)
+                       for key, train, val_steps, future_steps, series_order in chunk] for chunk in chunks]
+            if len(found) < len(searching):
+                # Prazo esgotado na busca: processos podem estar travados; as séries restantes buscam no ajuste
+                _terminate_workers(executor)
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=n_workers)
+
+        futures = {executor.submit(_fit_chunk, chunk, maxiter, timeout, fallback_window, interval): chunk
+                   for chunk in chunks}
+        pending = dict(futures)
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                chunk = pending.pop(future)
+                try:
+                    fitted.extend(future.result())
+                except Exception as e:
+                    fitted.extend(_fallback_chunk(chunk, f"erro no processo: {type(e).__name__}", fallback_window))
+        except FuturesTimeoutError:
+            for chunk in pending.values():
+                fitted.extend(_fallback_chunk(chunk, "timeout", fallback_window))
+        finally:
+            if pending:
+                _terminate_workers(executor)
+            executor.shutdown(wait=not pending, cancel_futures=True)
+
+    train_by_key = {item[0]: item[1] for item in series}
+    results = {}
+    report = []
+    for key, val_preds, future_preds, reason, seconds, series_order, bounds in fitted:
+        results[key] = {
+            "method": "ARIMA",
+            "pred_years": future_years,
+            "predictions": [float(p) for p in future_preds],
+            "validation_predictions": dict(zip(val_years_by_key[key], val_preds)),
+            "order": series_order,
+            "fallback": reason,
+            "fit_seconds": seconds
+        }
+        if order == "auto" and order_cache is not None and series_order is not None:
+            order_cache.put(key, train_by_key[key], series_order)
+        if interval is not None:
+            # Séries que caíram na janela de média ficam sem intervalo
+            nan_bounds = ([np.nan] * len(future_years), [np.nan] * len(future_years))
+            results[key].update(interval_fields(interval, *(bounds if bounds is not None else nan_bounds)))
+        if reason is not None:
+            results[key]["note"] = f"ARIMA substituído por janela de média({fallback_window}): {reason}"
+        report.append({
+            "id_municipio": key[0],
+            "bioma": key[1],
+            "order": series_order,
+            "fallback": reason is not None,
+            "motivo": reason,
+            "fit_seconds": seconds
+        })
+
+    if order == "auto" and order_cache is not None:
+        order_cache.save()
+
+    report_df = pd.DataFrame(report).sort_values(["bioma", "id_municipio"]).reset_index(drop=True)
+    return results, report_df
+
+
+def _terminate_workers(executor):
+    # shutdown(cancel_futures=True) não interrompe um ajuste em andamento, e o atexit do concurrent.futures
+    # esperaria pelos processos travados; encerrá-los libera o pool
+    for process in list((executor._processes or {}).values()):
+        if process.is_alive():
+            process.terminate()
+
+
+def _fallback_chunk(chunk, reason, fallback_window):
+    return [
+        (key,
+         moving_average_forecast(train_series, val_steps, fallback_window),
+         moving_average_forecast(train_series, future_steps, fallback_window),
+         reason,
+         0.0,
+         None,
+         None)
+        for key, train_series, val_steps, future_steps, _ in chunk
+    ]
@@ -0,0 +1,119 @@
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+
+import numpy as np
+from splitter.train_val_split import split_series
+
+CACHE_VERSION = 1
+
+
+def series_hash(values) -> str:
+    return hashlib.sha256(np.ascontiguousarray(values, dtype=np.float64).tobytes()).hexdigest()
+
+
+class ForecastCache:
+    def __init__(self, cache_dir: str = ".forecast_cache", max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".pkl")]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def make_key(self, predictor, split, params: dict) -> str:
+        h = hashlib.sha256()
+        h.update(f"{CACHE_VERSION}|{predictor.__module__}.{predictor.__qualname__}".encode())
+        h.update(np.ascontiguousarray(split.years, dtype=np.int64).tobytes())
+        h.update(np.ascontiguousarray(split.values, dtype=np.float64).tobytes())
+        h.update(repr((split.train_end, split.val_start, split.val_end, list(split.future_years))).encode())
+        h.update(repr(sorted(params.items())).encode())
+        return h.hexdigest()
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        # Atualiza o mtime para a remoção por antiguidade funcionar como LRU
+        os.utime(path)
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result):
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        if os.path.exists(path):
+            self.total_bytes -= os.path.getsize(path)
+        os.replace(tmp_path, path)
+        self.total_bytes += os.path.getsize(path)
+
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        for entry in self._entries():
+            os.remove(entry.path)
+        self.total_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries()),
+            "bytes": self.total_bytes,
+        }
+
+
+def cached_predict(predictor, data, cache: ForecastCache = None, **params):
+    split = split_series(data, train_end=params.pop("train_end", 2020))
+    if cache is None:
+        return predictor(split, **params)
+
+    # Hiperparâmetros com os defaults preenchidos: omitir window=3 ou passá-lo gera a mesma chave
+    bound = inspect.signature(predictor).bind_partial(split, **params)
+    bound.apply_defaults()
+    key_params = {name: value for name, value in list(bound.arguments.items())[1:] if name != "train_end"}
+
+    key = cache.make_key(predictor, split, key_params)
+    result = cache.get(key)
+    if result is None:
+        result = predictor(split, **params)
+        # Resultado de contingência (ex.: ARIMA que estourou o prazo) não é reaproveitado nas próximas execuções
+        if not result.get("fallback"):
+            cache.put(key, result)
+
+    return result
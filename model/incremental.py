@@ -0,0 +1,177 @@
+import warnings
+from collections import deque
+
+import numpy as np
+
+
+class IncrementalLinearRegression:
+    method = "regressao_linear"
+
+    def __init__(self):
+        # Somas suficientes; x é o ano relativo ao primeiro ano visto
+        self.min_year = None
+        self.n = 0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+
+    def update(self, years, values):
+        years = np.asarray(years, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(years) == 0:
+            return self
+        if self.min_year is None:
+            self.min_year = float(years.min())
+        x = years - self.min_year
+        self.n += len(x)
+        self.sx += x.sum()
+        self.sy += values.sum()
+        self.sxx += (x * x).sum()
+        self.sxy += (x * values).sum()
+        return self
+
+    @property
+    def coef(self):
+        denom = self.n * self.sxx - self.sx ** 2
+        return (self.n * self.sxy - self.sx * self.sy) / denom if denom > 0 else 0.0
+
+    @property
+    def intercept(self):
+        return (self.sy - self.coef * self.sx) / self.n
+
+    def forecast(self, years):
+        x = np.asarray(years, dtype=np.float64) - self.min_year
+        return (self.intercept + self.coef * x).tolist()
+
+
+class IncrementalMovingAverage:
+    def __init__(self, window: int = 3):
+        self.window = window
+        self.buffer = deque(maxlen=window)
+        self.total = 0.0
+
+    @property
+    def method(self):
+        return f"Janela de média({self.window})"
+
+    def update(self, years, values):
+        for value in np.asarray(values, dtype=np.float64):
+            if len(self.buffer) == self.window:
+                self.total -= self.buffer[0]
+            self.buffer.append(value)
+            self.total += value
+        return self
+
+    def forecast(self, years):
+        buffer = deque(self.buffer, maxlen=len(self.buffer))
+        total = self.total
+        preds = []
+        for _ in range(len(years)):
+            next_pred = total / len(buffer)
+            preds.append(float(next_pred))
+            total += next_pred - buffer[0]
+            buffer.append(next_pred)
+        return preds
+
+
+class IncrementalVariance:
+    method = "variancia"
+
+    def __init__(self):
+        # Welford: média e soma de quadrados atualizadas observação a observação
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.first = None
+        self.last = None
+
+    def update(self, years, values):
+        for value in np.asarray(values, dtype=np.float64):
+            if self.first is None:
+                self.first = value
+            self.last = value
+            self.n += 1
+            delta = value - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (value - self.mean)
+        return self
+
+    @property
+    def std_dev(self):
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.nan
+
+    def forecast(self, years):
+        trend_direction = 1 if self.last > self.first else -1
+        step = trend_direction * self.std_dev
+        preds = []
+        current = self.last
+        for _ in range(len(years)):
+            current = current + step
+            preds.append(float(current))
+        return preds
+
+
+class IncrementalArima:
+    method = "ARIMA"
+
+    def __init__(self, order=(1, 1, 1), maxiter=None):
+        self.order = order
+        self.maxiter = maxiter
+        # Só parâmetros e histórico são guardados em disco; o ARIMAResults é refeito sob demanda
+        self.params = None
+        self.values = np.empty(0)
+        self._result = None
+
+    def __getstate__(self):
+        # O ARIMAResults completo ocupa dezenas de KB por série no pickle
+        state = dict(self.__dict__)
+        state["_result"] = None
+        return state
+
+    @property
+    def result(self):
+        if self._result is None and self.params is not None:
+            from statsmodels.tsa.arima.model import ARIMA
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                self._result = ARIMA(self.values, order=self.order).filter(self.params)
+        return self._result
+
+    def update(self, years, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return self
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if self.params is None:
+                from statsmodels.tsa.arima.model import ARIMA
+
+                model = ARIMA(values, order=self.order)
+                if self.maxiter is None:
+                    self._result = model.fit()
+                else:
+                    self._result = model.fit(method_kwargs={"maxiter": self.maxiter})
+                self.params = np.asarray(self._result.params)
+            else:
+                # Estende o estado com as novas observações mantendo os parâmetros já estimados
+                self._result = self.result.append(values, refit=False)
+        self.values = np.concatenate([self.values, values])
+        return self
+
+    def forecast(self, years):
+        return np.asarray(self.result.forecast(steps=len(years))).tolist()
+
+
+def new_incremental_state(model, window=3, order=(1, 1, 1)):
+    # Única fábrica dos estados incrementais, usada no backtest e na atualização anual
+    if model == "variance":
+        return IncrementalVariance()
+    if model == "moving_average":
+        return IncrementalMovingAverage(window)
+    if model == "linear_regression":
+        return IncrementalLinearRegression()
+    if model == "arima":
+        return IncrementalArima(order)
+    raise ValueError(f"Modelo sem forma incremental: {model}")
@@ -1,31 +1,42 @@
 import numpy as np
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error, mean_absolute_error
-from splitter.train_val_split import train_val_split
+from splitter.train_val_split import split_series
+from evaluation.profiling import make_profiler
+from ._batch import prepare_batch, validation_dict, batch_results_frame
+from ._intervals import packed_residuals, bootstrap_bounds, additive_simulator, interval_fields
 
-def predict_linear_regression(df_filtrado, train_end=2020):
-    train_df, val_df, future_years = train_val_split(df_filtrado, train_end=train_end)
+def predict_linear_regression(df_filtrado, train_end=2020, profile=False, interval=None, n_resamples=1000,
+                              random_state=42):
+    profiler = make_profiler(profile)
 
-    min_year = train_df["ano"].min()
-    x_train = (train_df[["ano"]].values - min_year).reshape(-1, 1)
-    y_train = train_df["desmatado"].values
+    with profiler.stage("split"):
+        split = split_series(df_filtrado, train_end=train_end)
+    future_years = split.future_years
 
-    x_val = (val_df[["ano"]].values - min_year).reshape(-1, 1)
-    y_val = val_df["desmatado"].values
+    with profiler.stage("features"):
+        min_year = split.train_years.min()
+        x_train = (split.train_years - min_year).reshape(-1, 1)
+        y_train = split.train_values
 
-    model = LinearRegression()
-    model.fit(x_train, y_train)
+        x_val = (split.val_years - min_year).reshape(-1, 1)
+        y_val = split.val_values
 
-    y_val_pred = model.predict(x_val)
-    val_preds = dict(zip(val_df["ano"].values, y_val_pred))
+    with profiler.stage("fit"):
+        model = LinearRegression()
+        model.fit(x_train, y_train)
 
-    val_rmse = np.sqrt(mean_squared_error(y_val, y_val_pred))
-    val_mae = mean_absolute_error(y_val, y_val_pred)
+    with profiler.stage("predict"):
+        y_val_pred = model.predict(x_val)
+        val_preds = dict(zip(split.val_years, y_val_pred))
 
-    x_future = (np.array(future_years).reshape(-1, 1) - min_year)
-    y_future = model.predict(x_future)
+        val_rmse = np.sqrt(mean_squared_error(y_val, y_val_pred))
+        val_mae = mean_absolute_error(y_val, y_val_pred)
 
-    return {
+        x_future = (np.array(future_years).reshape(-1, 1) - min_year)
+        y_future = model.predict(x_future)
+
+    result = {
         "method": "regressao_linear",
         "pred_years": future_years,
         "predictions": y_future.tolist(),
@@ -34,4 +45,73 @@ def predict_linear_regression(df_filtrado, train_end=2020):
         "val_mae": float(val_mae),
         "coef": float(model.coef_[0]),
         "intercept": float(model.intercept_)
-    }
\ No newline at end of file
+    }
+
+    if interval is not None:
+        with profiler.stage("intervals"):
+            residuals, n_resid = packed_residuals((y_train - model.predict(x_train))[None, :],
+                                                  np.ones((1, len(y_train)), dtype=bool))
+            lower, upper = bootstrap_bounds(residuals, n_resid, additive_simulator(y_future[None, :]),
+                                            len(future_years), interval, n_resamples, random_state)
+        result.update(interval_fields(interval, lower[0], upper[0]))
+
+    return profiler.attach(result)
+
+def predict_linear_regression_batch(df, train_end=2020, val_start=2021, val_end=2023, future_years=None,
+                                    interval=None, n_resamples=1000, random_state=42):
+    if future_years is None:
+        future_years = list(range(val_end + 1, val_end + 6))
+
+    matrix, keys, values, train_mask, val_mask = prepare_batch(df, train_end, val_start, val_end)
+
+    years = matrix.years.astype(np.float64)
+    min_year = np.where(train_mask, years, np.inf).min(axis=1)
+    x = years[None, :] - min_year[:, None]
+
+    # Mínimos quadrados fechados por série, usando só os anos de treino observados
+    n = train_mask.sum(axis=1)
+    x_mean = np.where(train_mask, x, 0.0).sum(axis=1) / n
+    y_mean = np.where(train_mask, values, 0.0).sum(axis=1) / n
+    dx = np.where(train_mask, x - x_mean[:, None], 0.0)
+    dy = np.where(train_mask, values - y_mean[:, None], 0.0)
+    sxx = (dx * dx).sum(axis=1)
+    sxy = (dx * dy).sum(axis=1)
+
+    coef = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0)
+    intercept = y_mean - coef * x_mean
+
+    fitted = intercept[:, None] + coef[:, None] * x
+    val_err = np.where(val_mask, values - fitted, 0.0)
+    n_val = val_mask.sum(axis=1)
+    val_rmse = np.sqrt((val_err ** 2).sum(axis=1) / n_val)
+    val_mae = np.abs(val_err).sum(axis=1) / n_val
+
+    x_future = np.asarray(future_years, dtype=np.float64)[None, :] - min_year[:, None]
+    y_future = intercept[:, None] + coef[:, None] * x_future
+
+    results = {}
+    for i, key in enumerate(keys):
+        results[key] = {
+            "method": "regressao_linear",
+            "pred_years": future_years,
+            "predictions": y_future[i].tolist(),
+            "validation_predictions": validation_dict(matrix.years, fitted[i], val_mask[i]),
+            "val_rmse": float(val_rmse[i]),
+            "val_mae": float(val_mae[i]),
+            "coef": float(coef[i]),
+            "intercept": float(intercept[i])
+        }
+
+    lower = upper = None
+    if interval is not None:
+        # Reamostragem dos resíduos de treino: (reamostragens × séries × horizonte) em blocos de séries
+        residuals, n_resid = packed_residuals(values - fitted, train_mask)
+        lower, upper = bootstrap_bounds(residuals, n_resid, additive_simulator(y_future), len(future_years),
+                                        interval, n_resamples, random_state)
+        for i, key in enumerate(keys):
+            results[key].update(interval_fields(interval, lower[i], upper[i]))
+
+    frame = batch_results_frame("regressao_linear", keys, matrix.years, fitted, val_mask,
+                                future_years, y_future, lower, upper)
+
+    return results, frame
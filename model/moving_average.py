@@ -1,30 +1,98 @@
 import numpy as np
-from splitter.train_val_split import train_val_split
+from splitter.train_val_split import split_series
+from evaluation.profiling import make_profiler
+from ._batch import prepare_batch, right_align, steps_to_val, validation_dict, batch_results_frame
+from ._intervals import moving_average_bounds, interval_fields
 
-def predict_moving_average(df_filtrado, window: int = 3, train_end=2020):
-    train_df, val_df, future_years = train_val_split(df_filtrado, train_end=train_end)
 
-    train_series = train_df.sort_values("ano")["desmatado"].values
+def moving_average_forecast(train_series, steps, window: int = 3):
+    preds = []
+    current_window = np.asarray(train_series)[-window:].copy()
 
-    future_preds = []
-    current_window = train_series[-window:].copy()
-
-    for year in future_years:
+    for _ in range(steps):
         next_pred = float(np.mean(current_window))
-        future_preds.append(next_pred)
+        preds.append(next_pred)
         current_window = np.append(current_window[1:], next_pred)
 
-    val_preds = {}
-    val_window = train_series[-window:].copy()
+    return preds
+
+
+def predict_moving_average(df_filtrado, window: int = 3, train_end=2020, profile=False, interval=None,
+                           n_resamples=1000, random_state=42):
+    profiler = make_profiler(profile)
+
+    with profiler.stage("split"):
+        split = split_series(df_filtrado, train_end=train_end)
+    future_years = split.future_years
+
+    train_series = split.train_values
 
-    for year in sorted(val_df["ano"]):
-        next_val_pred = float(np.mean(val_window))
-        val_preds[year] = next_val_pred
-        val_window = np.append(val_window[1:], next_val_pred)
+    with profiler.stage("predict"):
+        future_preds = moving_average_forecast(train_series, len(future_years), window)
 
-    return {
+        val_years = split.val_years
+        val_preds = dict(zip(val_years, moving_average_forecast(train_series, len(val_years), window)))
+
+    result = {
         "method": f"Janela de média({window})",
         "pred_years": future_years,
         "predictions": future_preds,
         "validation_predictions": val_preds
-    }
\ No newline at end of file
+    }
+
+    if interval is not None:
+        with profiler.stage("intervals"):
+            train = np.asarray(train_series, dtype=np.float64)[None, :]
+            lower, upper = moving_average_bounds(train, np.array([train.shape[1]]), window, len(future_years),
+                                                 interval, n_resamples, random_state)
+        result.update(interval_fields(interval, lower[0], upper[0]))
+
+    return profiler.attach(result)
+
+
+def predict_moving_average_batch(df, window: int = 3, train_end=2020, val_start=2021, val_end=2023,
+                                 future_years=None, interval=None, n_resamples=1000, random_state=42):
+    if future_years is None:
+        future_years = list(range(val_end + 1, val_end + 6))
+
+    matrix, keys, values, train_mask, val_mask = prepare_batch(df, train_end, val_start, val_end)
+    packed, n_train = right_align(values, train_mask)
+
+    # Janela de largura fixa; séries com menos de `window` anos usam só os anos que têm
+    buffer = packed[:, -window:]
+    if buffer.shape[1] < window:
+        buffer = np.pad(buffer, ((0, 0), (window - buffer.shape[1], 0)), constant_values=np.nan)
+    width = np.minimum(n_train, window)
+    active = np.arange(window)[None, :] >= (window - width)[:, None]
+    full = width == window
+
+    horizon = max(len(future_years), int(val_mask.sum(axis=1).max()))
+    steps = np.empty((len(keys), horizon))
+    for h in range(horizon):
+        steps[:, h] = np.where(full, buffer.mean(axis=1), np.where(active, buffer, 0.0).sum(axis=1) / width)
+        buffer = np.concatenate([buffer[:, 1:], steps[:, h:h + 1]], axis=1)
+
+    future_preds = steps[:, :len(future_years)]
+    val_preds = steps_to_val(steps, val_mask)
+    method = f"Janela de média({window})"
+
+    results = {}
+    for i, key in enumerate(keys):
+        results[key] = {
+            "method": method,
+            "pred_years": future_years,
+            "predictions": future_preds[i].tolist(),
+            "validation_predictions": validation_dict(matrix.years, val_preds[i], val_mask[i])
+        }
+
+    lower = upper = None
+    if interval is not None:
+        lower, upper = moving_average_bounds(packed, n_train, window, len(future_years), interval, n_resamples,
+                                             random_state)
+        for i, key in enumerate(keys):
+            results[key].update(interval_fields(interval, lower[i], upper[i]))
+
+    frame = batch_results_frame(method, keys, matrix.years, val_preds, val_mask, future_years, future_preds,
+                                lower, upper)
+
+    return results, frame
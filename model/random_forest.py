@@ -1,72 +1,240 @@
 import numpy as np
+import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
-from splitter.train_val_split import train_val_split
+from splitter.train_val_split import SeriesSplit, split_series
+from evaluation.profiling import make_profiler
+from ._batch import prepare_batch, steps_to_val, validation_dict, batch_results_frame
+from ._intervals import interval_fields
 
-def predict_random_forest(df_filtrado, train_end=2020, n_estimators=200, random_state=42):
-    train_df, val_df, future_years = train_val_split(df_filtrado, train_end=train_end)
+FEATURE_COLS = ["lag1", "lag2", "lag3", "rolling_mean_3", "year_normalized"]
 
-    full = df_filtrado.sort_values("ano").copy()
 
-    full["lag1"] = full["desmatado"].shift(1)
-    full["lag2"] = full["desmatado"].shift(2)
-    full["lag3"] = full["desmatado"].shift(3)
-    full["rolling_mean_3"] = full["desmatado"].rolling(3, min_periods=1).mean()
-    full["year_normalized"] = full["ano"] - full["ano"].min()
+def _tree_bounds(model, x_in, level):
+    # Quantis entre as árvores da floresta para as mesmas features (linhas de x_in)
+    alpha = (1 - level) / 2
+    per_tree = np.stack([tree.predict(x_in) for tree in model.estimators_])
+    return np.quantile(per_tree, [alpha, 1 - alpha], axis=0)
 
-    train = full[full["ano"] <= train_end].dropna(subset=["lag1", "lag2", "lag3"]).copy()
+
+def _advance_features(last_known, yhat):
+    # Mesma atualização recursiva para uma série (1D) ou várias de uma vez (2D)
+    last_known[..., 0] = yhat
+    last_known[..., 1] = last_known[..., 0]
+    last_known[..., 2] = last_known[..., 1]
+    last_known[..., 3] = np.mean(last_known[..., :3], axis=-1)
+
+
+def predict_random_forest(df_filtrado, train_end=2020, n_estimators=200, random_state=42, n_jobs=-1,
+                          profile=False, interval=None):
+    profiler = make_profiler(profile)
+
+    with profiler.stage("split"):
+        split = split_series(df_filtrado, train_end=train_end)
+    future_years = split.future_years
+    train_end = split.train_end
+
+    with profiler.stage("features"):
+        full = pd.DataFrame({"ano": split.years, "desmatado": split.values})
+
+        full["lag1"] = full["desmatado"].shift(1)
+        full["lag2"] = full["desmatado"].shift(2)
+        full["lag3"] = full["desmatado"].shift(3)
+        full["rolling_mean_3"] = full["desmatado"].rolling(3, min_periods=1).mean()
+        full["year_normalized"] = full["ano"] - full["ano"].min()
+
+        train = full[full["ano"] <= train_end].dropna(subset=["lag1", "lag2", "lag3"]).copy()
 
     if train.shape[0] < 4:
-        mean_val = train["desmatado"].mean() if not train.empty else float(df_filtrado["desmatado"].mean())
-        val_preds = {year: mean_val for year in val_df["ano"]}
-        return {
+        mean_val = train["desmatado"].mean() if not train.empty else float(np.nanmean(split.values))
+        val_preds = {year: mean_val for year in split.val_years}
+        result = {
             "method": "random_forest",
             "pred_years": future_years,
             "predictions": [mean_val] * len(future_years),
             "validation_predictions": val_preds
         }
+        if interval is not None:
+            # Sem floresta ajustada não há dispersão entre árvores: intervalo indefinido
+            result.update(interval_fields(interval, [np.nan] * len(future_years), [np.nan] * len(future_years)))
+        return profiler.attach(result)
 
-    feature_cols = ["lag1", "lag2", "lag3", "rolling_mean_3", "year_normalized"]
+    feature_cols = FEATURE_COLS
     x_train = train[feature_cols].values
     y_train = train["desmatado"].values
 
-    model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state, n_jobs=-1)
-    model.fit(x_train, y_train)
+    with profiler.stage("fit"):
+        model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state, n_jobs=n_jobs)
+        model.fit(x_train, y_train)
 
-    val_preds = {}
-    last_known = train[feature_cols].iloc[-1].values.copy()
-    val_years = sorted(val_df["ano"])
+    with profiler.stage("predict"):
+        val_preds = {}
+        last_known = train[feature_cols].iloc[-1].values.copy()
+        val_years = split.val_years
 
-    for year in val_years:
-        features = last_known.copy()
-        features[4] = year - full["ano"].min()
+        for year in val_years:
+            features = last_known.copy()
+            features[4] = year - full["ano"].min()
 
-        x_in = features.reshape(1, -1)
-        yhat = model.predict(x_in)[0]
-        val_preds[year] = float(yhat)
+            x_in = features.reshape(1, -1)
+            yhat = model.predict(x_in)[0]
+            val_preds[year] = float(yhat)
 
-        last_known[0] = yhat
-        last_known[1] = last_known[0]
-        last_known[2] = last_known[1]
-        last_known[3] = np.mean([last_known[0], last_known[1], last_known[2]])
+            _advance_features(last_known, yhat)
 
-    future_preds = []
-    for year in future_years:
-        features = last_known.copy()
-        features[4] = year - full["ano"].min()
+        future_preds = []
+        lower, upper = [], []
+        for year in future_years:
+            features = last_known.copy()
+            features[4] = year - full["ano"].min()
 
-        x_in = features.reshape(1, -1)
-        yhat = model.predict(x_in)[0]
-        future_preds.append(float(yhat))
+            x_in = features.reshape(1, -1)
+            yhat = model.predict(x_in)[0]
+            future_preds.append(float(yhat))
+            if interval is not None:
+                low, high = _tree_bounds(model, x_in, interval)
+                lower.append(low[0])
+                upper.append(high[0])
 
-        last_known[0] = yhat
-        last_known[1] = last_known[0]
-        last_known[2] = last_known[1]
-        last_known[3] = np.mean([last_known[0], last_known[1], last_known[2]])
+            _advance_features(last_known, yhat)
 
-    return {
+    result = {
         "method": "random_forest",
         "pred_years": future_years,
         "predictions": future_preds,
         "validation_predictions": val_preds,
         "feature_importance": dict(zip(feature_cols, model.feature_importances_))
-    }
\ No newline at end of file
+    }
+    if interval is not None:
+        result.update(interval_fields(interval, lower, upper))
+
+    return profiler.attach(result)
+
+
+def predict_random_forest_batch(df, train_end=2020, val_start=2021, val_end=2023, future_years=None,
+                                n_estimators=200, random_state=42, n_jobs=1, interval=None):
+    # Modo por série: uma floresta por série, sem paralelismo interno por chamada
+    if future_years is None:
+        future_years = list(range(val_end + 1, val_end + 6))
+
+    matrix, keys, values, train_mask, val_mask = prepare_batch(df, train_end, val_start, val_end)
+    col = {int(year): j for j, year in enumerate(matrix.years)}
+
+    val_preds = np.full(values.shape, np.nan)
+    future_preds = np.full((len(keys), len(future_years)), np.nan)
+    lower = upper = None
+    if interval is not None:
+        lower = np.full(future_preds.shape, np.nan)
+        upper = np.full(future_preds.shape, np.nan)
+
+    results = {}
+    for i, key in enumerate(keys):
+        observed = ~np.isnan(values[i])
+        split = SeriesSplit(matrix.years[observed], values[i, observed], train_end=train_end, val_start=val_start,
+                            val_end=val_end, future_years=future_years)
+        results[key] = predict_random_forest(split, n_estimators=n_estimators, random_state=random_state,
+                                             n_jobs=n_jobs, interval=interval)
+
+        for year, pred in results[key]["validation_predictions"].items():
+            val_preds[i, col[int(year)]] = pred
+        future_preds[i] = results[key]["predictions"]
+        if interval is not None:
+            lower[i], upper[i] = results[key]["lower"], results[key]["upper"]
+
+    frame = batch_results_frame("random_forest", keys, matrix.years, val_preds, val_mask, future_years,
+                                future_preds, lower, upper)
+
+    return results, frame
+
+
+def predict_random_forest_global(df, train_end=2020, val_start=2021, val_end=2023, future_years=None,
+                                 n_estimators=200, random_state=42, n_jobs=-1, interval=None):
+    if future_years is None:
+        future_years = list(range(val_end + 1, val_end + 6))
+
+    matrix, keys, values, train_mask, val_mask = prepare_batch(df, train_end, val_start, val_end)
+
+    full = df[["id_municipio", "bioma", "ano", "desmatado"]].copy()
+    full["bioma"] = full["bioma"].astype(str)
+    full = full.sort_values(["id_municipio", "bioma", "ano"]).reset_index(drop=True)
+
+    grouped = full.groupby(["id_municipio", "bioma"], sort=False)["desmatado"]
+    full["lag1"] = grouped.shift(1)
+    full["lag2"] = grouped.shift(2)
+    full["lag3"] = grouped.shift(3)
+    full["rolling_mean_3"] = grouped.rolling(3, min_periods=1).mean().reset_index(level=[0, 1], drop=True)
+    year_min = full.groupby(["id_municipio", "bioma"], sort=False)["ano"].transform("min")
+    full["year_normalized"] = full["ano"] - year_min
+
+    train = full[full["ano"] <= train_end].dropna(subset=["lag1", "lag2", "lag3"])
+    if train.empty:
+        raise ValueError("Nenhuma linha de treino com defasagens completas — verifique train_end.")
+
+    model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state, n_jobs=n_jobs)
+    model.fit(train[FEATURE_COLS].values, train["desmatado"].values)
+
+    # Estado inicial: última linha de treino completa de cada série
+    last_rows = train.groupby(["id_municipio", "bioma"], sort=False).tail(1).set_index(["id_municipio", "bioma"])
+    last_rows = last_rows.reindex(pd.MultiIndex.from_tuples(keys, names=["id_municipio", "bioma"]))
+    has_model = last_rows["lag1"].notna().to_numpy()
+
+    year_min = full.groupby(["id_municipio", "bioma"])["ano"].min().reindex(last_rows.index).to_numpy()
+    last_known = last_rows[FEATURE_COLS].to_numpy(dtype=np.float64)
+    last_known[~has_model] = 0.0
+
+    # Séries sem linha de treino completa recebem a média do treino, como no modo por série
+    fallback_mean = np.nanmean(np.where(train_mask, values, np.nan), axis=1)
+
+    n_val = val_mask.sum(axis=1)
+    val_year_steps = np.where(val_mask, matrix.years[None, :], np.iinfo(np.int64).max)
+    val_year_steps = np.sort(val_year_steps, axis=1)[:, :int(n_val.max())]
+
+    val_steps = np.empty(val_year_steps.shape)
+    for k in range(val_year_steps.shape[1]):
+        active = (k < n_val) & has_model
+        features = last_known.copy()
+        features[:, 4] = val_year_steps[:, k] - year_min
+        yhat = np.full(len(keys), np.nan)
+        if active.any():
+            yhat[active] = model.predict(features[active])
+            advanced = last_known[active]
+            _advance_features(advanced, yhat[active])
+            last_known[active] = advanced
+        val_steps[:, k] = yhat
+
+    future_preds = np.empty((len(keys), len(future_years)))
+    lower = upper = None
+    if interval is not None:
+        lower = np.full(future_preds.shape, np.nan)
+        upper = np.full(future_preds.shape, np.nan)
+    for h, year in enumerate(future_years):
+        features = last_known.copy()
+        features[:, 4] = year - year_min
+        yhat = np.full(len(keys), np.nan)
+        if has_model.any():
+            yhat[has_model] = model.predict(features[has_model])
+            if interval is not None:
+                lower[has_model, h], upper[has_model, h] = _tree_bounds(model, features[has_model], interval)
+            _advance_features(last_known, np.where(has_model, yhat, 0.0))
+        future_preds[:, h] = yhat
+
+    val_preds = steps_to_val(val_steps, val_mask)
+    val_preds = np.where(has_model[:, None], val_preds, np.where(val_mask, fallback_mean[:, None], np.nan))
+    future_preds = np.where(has_model[:, None], future_preds, fallback_mean[:, None])
+
+    importance = dict(zip(FEATURE_COLS, model.feature_importances_))
+    results = {}
+    for i, key in enumerate(keys):
+        results[key] = {
+            "method": "random_forest",
+            "pred_years": future_years,
+            "predictions": future_preds[i].tolist(),
+            "validation_predictions": validation_dict(matrix.years, val_preds[i], val_mask[i]),
+            "feature_importance": importance
+        }
+        if interval is not None:
+            results[key].update(interval_fields(interval, lower[i], upper[i]))
+
+    frame = batch_results_frame("random_forest", keys, matrix.years, val_preds, val_mask,
+                                future_years, future_preds, lower, upper)
+
+    return results, frame
@@ -0,0 +1,66 @@
+import importlib
+
+# Cada modelo é só um nome até o primeiro uso: statsmodels/sklearn são importados sob demanda
+MODEL_REGISTRY = {
+    "variance": {
+        "label": "Variância",
+        "module": "model.variance",
+        "function": "predict_variance",
+        "params": {},
+    },
+    "moving_average": {
+        "label": "Janela de Média({window})",
+        "module": "model.moving_average",
+        "function": "predict_moving_average",
+        "params": {"window": 3},
+    },
+    "linear_regression": {
+        "label": "Regressão Linear",
+        "module": "model.linear_regression",
+        "function": "predict_linear_regression",
+        "params": {},
+    },
+    "random_forest": {
+        "label": "Random Forest",
+        "module": "model.random_forest",
+        "function": "predict_random_forest",
+        "params": {},
+    },
+    "arima": {
+        "label": "ARIMA",
+        "module": "model.arima",
+        "function": "predict_arima",
+        "params": {},
+    },
+}
+
+_loaded = {}
+
+
+def available_models():
+    return list(MODEL_REGISTRY)
+
+
+def _entry(name):
+    try:
+        return MODEL_REGISTRY[name]
+    except KeyError:
+        raise ValueError(f"Modelo desconhecido: {name}. Disponíveis: {available_models()}") from None
+
+
+def get_model(name):
+    if name not in _loaded:
+        entry = _entry(name)
+        module = importlib.import_module(entry["module"])
+        _loaded[name] = getattr(module, entry["function"])
+    return _loaded[name]
+
+
+def model_label(name, **params):
+    # Rótulos com hiperparâmetros (ex.: a janela da média) usam os do registro, sobrescritos pelos informados
+    entry = _entry(name)
+    return entry["label"].format(**{**entry["params"], **params})
+
+
+def model_params(name):
+    return dict(_entry(name)["params"])
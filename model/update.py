@@ -0,0 +1,164 @@
+import os
+import pickle
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from splitter.series_store import SeriesStore
+from splitter.train_val_split import SeriesSplit, split_years_for
+from .cache import ForecastCache, cached_predict, series_hash
+from .incremental import new_incremental_state
+from .registry import get_model
+
+UPDATE_MODELS = ["variance", "moving_average", "linear_regression", "random_forest", "arima"]
+
+
+def history_hash(years, values) -> str:
+    # Anos entram no hash: uma série revisada ou com ano faltando não reaproveita estado
+    return series_hash(np.column_stack([np.asarray(years, dtype=np.float64), np.asarray(values, dtype=np.float64)]))
+
+
+def _partition_name(bioma):
+    safe_bioma = "".join(c if c.isalnum() else "_" for c in str(bioma))
+    return f"bioma={safe_bioma}.pkl"
+
+
+class IncrementalStateStore:
+    # Um arquivo por bioma, carregado só quando alguma série dele é consultada e regravado só se mudou
+    def __init__(self, path: str = os.path.join(".forecast_cache", "incremental_states")):
+        self.path = path
+        self.partitions = {}
+        self.dirty = set()
+
+    def __repr__(self):
+        n_series = sum(len(entries) for entries in self.partitions.values())
+        return f"IncrementalStateStore({self.path!r}, {n_series} séries carregadas)"
+
+    def _partition(self, bioma):
+        if bioma not in self.partitions:
+            file_path = os.path.join(self.path, _partition_name(bioma))
+            entries = {}
+            if os.path.exists(file_path):
+                with open(file_path, "rb") as f:
+                    entries = pickle.load(f)
+            self.partitions[bioma] = entries
+        return self.partitions[bioma]
+
+    def get(self, series_key, years, values, window, order):
+        entry = self._partition(series_key[1]).get(series_key)
+        if entry is None or entry["window"] != window or tuple(entry["order"]) != tuple(order):
+            return None
+
+        # O estado só continua válido se o histórico que ele já viu não mudou
+        seen = years <= entry["train_end"]
+        if history_hash(years[seen], values[seen]) != entry["hash"]:
+            return None
+        return entry
+
+    def put(self, series_key, train_years, train_values, train_end, states, window, order):
+        self._partition(series_key[1])[series_key] = {
+            "train_end": int(train_end),
+            "hash": history_hash(train_years, train_values),
+            "states": states,
+            "window": window,
+            "order": tuple(order),
+        }
+        self.dirty.add(series_key[1])
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        for bioma in sorted(self.dirty, key=str):
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(self.partitions[bioma], f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, os.path.join(self.path, _partition_name(bioma)))
+        self.dirty.clear()
+
+
+def update_forecasts(df, last_year=None, models=None, window=3, order=(1, 1, 1),
+                     state_store: IncrementalStateStore = None, cache: ForecastCache = None):
+    if models is None:
+        models = UPDATE_MODELS
+    if last_year is None:
+        last_year = int(df["ano"].max())
+    if state_store is None:
+        state_store = IncrementalStateStore()
+
+    windows = split_years_for(last_year)
+    incremental_models = [m for m in models if m != "random_forest"]
+
+    results = {}
+    report = []
+
+    for key, ano, desmatado in SeriesStore(df):
+        try:
+            split = SeriesSplit(ano, desmatado, **windows)
+        except ValueError as e:
+            report.append({"id_municipio": key[0], "bioma": key[1], "modelo": None, "acao": "ignorada",
+                           "motivo": str(e)})
+            continue
+
+        entry = state_store.get(key, split.years, split.values, window, order)
+        states = dict(entry["states"]) if entry is not None else {}
+        seen_until = entry["train_end"] if entry is not None else None
+        series_results = {}
+
+        for model in incremental_models:
+            state = states.get(model)
+            action = "incremental"
+            if state is not None and seen_until <= split.train_end:
+                # Só os anos que passaram da validação para o treino desde a última execução
+                new = split.train_years > seen_until
+                try:
+                    state.update(split.train_years[new], split.train_values[new])
+                except Exception:
+                    state = None
+            else:
+                state = None
+
+            if state is None:
+                action = "reajuste"
+                state = new_incremental_state(model, window, order)
+                try:
+                    state.update(split.train_years, split.train_values)
+                except Exception as e:
+                    report.append({"id_municipio": key[0], "bioma": key[1], "modelo": model, "acao": "erro",
+                                   "motivo": f"{type(e).__name__}: {e}"})
+                    states.pop(model, None)
+                    continue
+            states[model] = state
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                val_preds = state.forecast(split.val_years)
+                future_preds = state.forecast(split.future_years)
+
+            series_results[model] = {
+                "method": state.method,
+                "pred_years": split.future_years,
+                "predictions": [float(p) for p in future_preds],
+                "validation_predictions": dict(zip(split.val_years, val_preds)),
+            }
+            report.append({"id_municipio": key[0], "bioma": key[1], "modelo": model, "acao": action,
+                           "motivo": None})
+
+        if "random_forest" in models:
+            # Sem forma incremental: reajuste completo, evitado pelo cache quando os dados não mudaram
+            hits = cache.hits if cache is not None else 0
+            series_results["random_forest"] = cached_predict(get_model("random_forest"), split, cache, n_jobs=1)
+            action = "cache" if cache is not None and cache.hits > hits else "reajuste"
+            report.append({"id_municipio": key[0], "bioma": key[1], "modelo": "random_forest", "acao": action,
+                           "motivo": None})
+
+        state_store.put(key, split.train_years, split.train_values, split.train_end, states, window, order)
+        results[key] = series_results
+
+    state_store.save()
+
+    report_df = pd.DataFrame(report, columns=["id_municipio", "bioma", "modelo", "acao", "motivo"])
+    counts = report_df["acao"].value_counts().to_dict()
+    print(f"Atualização até {last_year}: {counts}")
+
+    return results, report_df
@@ -1,35 +1,45 @@
 import numpy as np
-from splitter.train_val_split import train_val_split
+from splitter.train_val_split import split_series
+from evaluation.profiling import make_profiler
+from ._batch import prepare_batch, right_align, steps_to_val, validation_dict, batch_results_frame
+from ._intervals import variance_bounds, interval_fields
 
-def predict_variance(df_filtrado, train_end=2020):
-    train_df, val_df, future_years = train_val_split(df_filtrado, train_end=train_end)
+def predict_variance(df_filtrado, train_end=2020, profile=False, interval=None, n_resamples=1000,
+                     random_state=42):
+    profiler = make_profiler(profile)
 
-    train_sorted = train_df.sort_values("ano")
+    with profiler.stage("split"):
+        split = split_series(df_filtrado, train_end=train_end)
+    future_years = split.future_years
 
-    variance = train_sorted["desmatado"].var()
-    std_dev = np.sqrt(variance)
+    train_values = split.train_values
+
+    with profiler.stage("fit"):
+        variance = np.var(train_values, ddof=1) if len(train_values) > 1 else np.nan
+        std_dev = np.sqrt(variance)
 
-    first_value = train_sorted.iloc[0]["desmatado"]
-    last_value = train_sorted.iloc[-1]["desmatado"]
-    trend_direction = 1 if last_value > first_value else -1
+        first_value = train_values[0]
+        last_value = train_values[-1]
+        trend_direction = 1 if last_value > first_value else -1
 
-    future_preds = []
-    current_value = last_value
+    with profiler.stage("predict"):
+        future_preds = []
+        current_value = last_value
 
-    for year in future_years:
-        current_value = current_value + (trend_direction * std_dev)
-        future_preds.append(float(current_value))
+        for year in future_years:
+            current_value = current_value + (trend_direction * std_dev)
+            future_preds.append(float(current_value))
 
-    val_preds = {}
-    current_val = last_value
+        val_preds = {}
+        current_val = last_value
 
-    for year in sorted(val_df["ano"]):
-        current_val = current_val + (trend_direction * std_dev)
-        val_preds[year] = float(current_val)
+        for year in split.val_years:
+            current_val = current_val + (trend_direction * std_dev)
+            val_preds[year] = float(current_val)
 
     trend_desc = "crescente" if trend_direction > 0 else "decrescente"
 
-    return {
+    result = {
         "method": "variancia",
         "pred_years": future_years,
         "predictions": future_preds,
@@ -39,4 +49,71 @@ def predict_variance(df_filtrado, train_end=2020):
         "std_dev_step": float(std_dev),
         "trend_direction": trend_desc,
         "note": f"Método ingênuo usando variabilidade histórica (tendência {trend_desc}). Demonstra limitações."
-    }
\ No newline at end of file
+    }
+
+    if interval is not None:
+        with profiler.stage("intervals"):
+            lower, upper = variance_bounds(np.asarray(train_values, dtype=np.float64)[None, :],
+                                           np.array([last_value], dtype=np.float64),
+                                           np.array([trend_direction * std_dev]), len(future_years), interval,
+                                           n_resamples, random_state)
+        result.update(interval_fields(interval, lower[0], upper[0]))
+
+    return profiler.attach(result)
+
+
+def predict_variance_batch(df, train_end=2020, val_start=2021, val_end=2023, future_years=None, interval=None,
+                           n_resamples=1000, random_state=42):
+    if future_years is None:
+        future_years = list(range(val_end + 1, val_end + 6))
+
+    matrix, keys, values, train_mask, val_mask = prepare_batch(df, train_end, val_start, val_end)
+    packed, n_train = right_align(values, train_mask)
+
+    n_series, width = packed.shape
+    first_value = packed[np.arange(n_series), width - n_train]
+    last_value = packed[:, -1]
+
+    # Variância amostral (ddof=1) com máscara; indefinida para séries de um só ano
+    mean = np.nansum(packed, axis=1) / n_train
+    sq_dev = np.nansum((packed - mean[:, None]) ** 2, axis=1)
+    variance = np.divide(sq_dev, n_train - 1, out=np.full(n_series, np.nan), where=n_train > 1)
+    std_dev = np.sqrt(variance)
+
+    trend_direction = np.where(last_value > first_value, 1, -1)
+    step = trend_direction * std_dev
+
+    # Soma acumulada a partir do último valor reproduz a soma passo a passo do método por série
+    horizon = max(len(future_years), int(val_mask.sum(axis=1).max()))
+    increments = np.column_stack([last_value, np.repeat(step[:, None], horizon, axis=1)])
+    steps = np.cumsum(increments, axis=1)[:, 1:]
+
+    future_preds = steps[:, :len(future_years)]
+    val_preds = steps_to_val(steps, val_mask)
+
+    results = {}
+    for i, key in enumerate(keys):
+        trend_desc = "crescente" if trend_direction[i] > 0 else "decrescente"
+        results[key] = {
+            "method": "variancia",
+            "pred_years": future_years,
+            "predictions": future_preds[i].tolist(),
+            "validation_predictions": validation_dict(matrix.years, val_preds[i], val_mask[i]),
+            "last_known_value": float(last_value[i]),
+            "variance": float(variance[i]),
+            "std_dev_step": float(std_dev[i]),
+            "trend_direction": trend_desc,
+            "note": f"Método ingênuo usando variabilidade histórica (tendência {trend_desc}). Demonstra limitações."
+        }
+
+    lower = upper = None
+    if interval is not None:
+        lower, upper = variance_bounds(packed, last_value, step, len(future_years), interval, n_resamples,
+                                       random_state)
+        for i, key in enumerate(keys):
+            results[key].update(interval_fields(interval, lower[i], upper[i]))
+
+    frame = batch_results_frame("variancia", keys, matrix.years, val_preds, val_mask, future_years, future_preds,
+                                lower, upper)
+
+    return results, frame
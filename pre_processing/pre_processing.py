@@ -1,6 +1,122 @@
 import os
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 
+KEY_COLS = ["bioma", "id_municipio", "ano"]
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    # Só converte as colunas presentes: leituras parciais (ex.: só "ano") também passam por aqui
+    df = df.copy()
+    if "bioma" in df.columns:
+        df["bioma"] = df["bioma"].astype("category")
+    if "id_municipio" in df.columns:
+        df["id_municipio"] = df["id_municipio"].astype(np.int32)
+    if "ano" in df.columns:
+        df["ano"] = df["ano"].astype(np.int16)
+
+    measures = [c for c in df.select_dtypes(include="number").columns if c not in KEY_COLS]
+    df[measures] = df[measures].astype(np.float32)
+
+    return df
+
+
+def save_processed_parquet(df: pd.DataFrame, processed_path: str):
+    # Um diretório por bioma (particionamento estilo hive: bioma=<nome>/part-0.parquet)
+    if os.path.isdir(processed_path):
+        shutil.rmtree(processed_path)
+
+    for bioma, df_bioma in df.groupby("bioma", sort=True, observed=True):
+        part_dir = os.path.join(processed_path, f"bioma={bioma}")
+        os.makedirs(part_dir, exist_ok=True)
+        df_bioma.drop(columns="bioma").to_parquet(os.path.join(part_dir, "part-0.parquet"), index=False)
+
+
+def load_processed(processed_path: str, columns=None, biomas=None) -> pd.DataFrame:
+    if processed_path.endswith(".csv"):
+        # O filtro por bioma precisa da coluna mesmo quando ela não foi pedida
+        usecols = columns
+        if columns is not None and biomas is not None and "bioma" not in columns:
+            usecols = list(columns) + ["bioma"]
+        df = pd.read_csv(processed_path, encoding="utf-8", low_memory=False, usecols=usecols)
+        if biomas is not None:
+            df = df[df["bioma"].isin(biomas)]
+        if columns is not None:
+            df = df[list(columns)]
+        return compact_dtypes(df).reset_index(drop=True)
+
+    filters = [("bioma", "in", list(biomas))] if biomas is not None else None
+    df = pd.read_parquet(processed_path, columns=columns, filters=filters)
+
+    if "bioma" in df.columns and not isinstance(df["bioma"].dtype, pd.CategoricalDtype):
+        df["bioma"] = df["bioma"].astype("category")
+
+    # Os arquivos de cada partição já saem ordenados; só reordena se a leitura embaralhou
+    if all(c in df.columns for c in KEY_COLS):
+        if not pd.MultiIndex.from_frame(df[KEY_COLS]).is_monotonic_increasing:
+            df = df.sort_values(KEY_COLS, kind="stable")
+
+    return df.reset_index(drop=True)
+
+
+def processed_years(processed_path: str) -> np.ndarray:
+    # Só a coluna de ano é lida: basta para saber até onde o armazenamento já vai
+    return np.sort(load_processed(processed_path, columns=["ano"])["ano"].unique())
+
+
+def _merge_into_partition(part_dir: str, df_new: pd.DataFrame):
+    # Cada arquivo da partição cobre os municípios a partir do seu primeiro id; as linhas novas entram no arquivo
+    # correspondente, regravado ordenado, para a leitura da partição continuar ordenada sem reordenar tudo
+    names = sorted(n for n in os.listdir(part_dir) if n.endswith(".parquet"))
+    if not names:
+        df_new.to_parquet(os.path.join(part_dir, "part-0.parquet"), index=False)
+        return
+
+    first_ids = [pd.read_parquet(os.path.join(part_dir, name), columns=["id_municipio"])["id_municipio"].min()
+                 for name in names]
+    target = np.maximum(np.searchsorted(first_ids, df_new["id_municipio"].to_numpy(), side="right") - 1, 0)
+
+    for i, rows in df_new.groupby(target, sort=True):
+        file_path = os.path.join(part_dir, names[i])
+        merged = pd.concat([pd.read_parquet(file_path), rows], ignore_index=True)
+        merged = merged.sort_values(["id_municipio", "ano"], kind="stable")
+        tmp_path = os.path.join(part_dir, f".{names[i]}.tmp")
+        merged.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, file_path)
+
+
+def append_new_years(raw_path: str, processed_path: str, chunksize: int = 500_000):
+    if processed_path.endswith(".csv") or not os.path.isdir(processed_path):
+        raise ValueError(f"Atualização incremental requer o armazenamento Parquet existente: {processed_path}")
+
+    last_year = int(processed_years(processed_path)[-1])
+
+    # O CSV bruto é percorrido em blocos, mas só as linhas de anos posteriores ao armazenamento são guardadas
+    new_parts = []
+    for chunk in pd.read_csv(raw_path, encoding="utf-8", low_memory=False, chunksize=chunksize):
+        chunk = chunk[chunk["ano"] > last_year]
+        if not chunk.empty:
+            new_parts.append(compact_dtypes(chunk))
+
+    if not new_parts:
+        print(f"Nenhum ano novo em {raw_path} (armazenamento já vai até {last_year}).")
+        return processed_path, []
+
+    df_new = pd.concat(new_parts, ignore_index=True).sort_values(KEY_COLS, kind="stable")
+    new_years = sorted(int(y) for y in df_new["ano"].unique())
+
+    for bioma, df_bioma in df_new.groupby("bioma", sort=True, observed=True):
+        part_dir = os.path.join(processed_path, f"bioma={bioma}")
+        os.makedirs(part_dir, exist_ok=True)
+        _merge_into_partition(part_dir, df_bioma.drop(columns="bioma"))
+
+    print(f"{len(df_new)} linhas dos anos {new_years} acrescentadas em: {processed_path}")
+
+    return processed_path, new_years
+
+
 def preprocess_and_save(raw_path: str, processed_path: str):
     df = pd.read_csv(raw_path, encoding="utf-8", low_memory=False)
 
@@ -32,7 +148,145 @@ def preprocess_and_save(raw_path: str, processed_path: str):
 
     os.makedirs(os.path.dirname(processed_path), exist_ok=True)
 
-    df_sorted.to_csv(processed_path, index=False, encoding="utf-8")
+    if processed_path.endswith(".csv"):
+        df_sorted.to_csv(processed_path, index=False, encoding="utf-8")
+    else:
+        df_sorted = compact_dtypes(df_sorted)
+        save_processed_parquet(df_sorted, processed_path)
     print(f"\nArquivo processado salvo em: {processed_path}")
 
     return df_sorted, processed_path
+
+
+def _bucket_name(bioma, uf) -> str:
+    return f"{bioma}__{int(uf):02d}"
+
+
+def _merge_sorted_runs(paths, batch_size):
+    # Junta runs já ordenadas por id_municipio e ano lendo blocos de `batch_size` linhas de cada uma: em memória
+    # fica no máximo um bloco por run, e a saída sai em pedaços já ordenados
+    import pyarrow.parquet as pq
+
+    readers = [pq.ParquetFile(path).iter_batches(batch_size=batch_size) for path in paths]
+
+    def next_block(i):
+        for batch in readers[i]:
+            if batch.num_rows:
+                return batch.to_pandas()
+        return None
+
+    def merge_key(block):
+        return block["id_municipio"].to_numpy(np.int64) * 10000 + block["ano"].to_numpy(np.int64)
+
+    blocks = [next_block(i) for i in range(len(readers))]
+    while any(block is not None for block in blocks):
+        # Tudo até a menor última chave entre os blocos em memória já pode sair
+        active = [i for i, block in enumerate(blocks) if block is not None]
+        bound = min(merge_key(blocks[i])[-1] for i in active)
+        pieces = []
+        for i in active:
+            n = int(np.searchsorted(merge_key(blocks[i]), bound, side="right"))
+            pieces.append(blocks[i].iloc[:n])
+            blocks[i] = blocks[i].iloc[n:] if n < len(blocks[i]) else next_block(i)
+        # Estável: chaves repetidas mantêm a ordem dos blocos do arquivo bruto
+        yield pd.concat(pieces, ignore_index=True).sort_values(["id_municipio", "ano"], kind="mergesort")
+
+
+def preprocess_and_save_chunked(raw_path: str, processed_path: str, chunksize: int = 500_000,
+                                spill_dir: str = None, merge_batch_size: int = 50_000):
+    # Partição por (bioma, UF): os dois primeiros dígitos do código IBGE são a UF, então
+    # concatenar as partições em ordem já produz a tabela ordenada por bioma, id_municipio e ano.
+    # Cada partição é montada por intercalação das runs ordenadas, em blocos de `merge_batch_size` linhas
+    # por run, e não carregada inteira
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    to_csv = processed_path.endswith(".csv")
+    own_spill = spill_dir is None
+    if own_spill:
+        spill_dir = tempfile.mkdtemp(prefix="prodes_spill_")
+
+    buckets = {}
+    for n_chunk, chunk in enumerate(pd.read_csv(raw_path, encoding="utf-8", low_memory=False,
+                                                chunksize=chunksize)):
+        # Saída CSV mantém os tipos originais, como em preprocess_and_save
+        if not to_csv:
+            chunk = compact_dtypes(chunk)
+        chunk = chunk.sort_values(KEY_COLS, kind="stable")
+        uf = chunk["id_municipio"] // 100000
+
+        for (bioma, uf_code), run in chunk.groupby([chunk["bioma"].astype(str), uf], sort=False, observed=True):
+            bucket = _bucket_name(bioma, uf_code)
+            bucket_dir = os.path.join(spill_dir, bucket)
+            os.makedirs(bucket_dir, exist_ok=True)
+            run.to_parquet(os.path.join(bucket_dir, f"run-{n_chunk:06d}.parquet"), index=False,
+                           row_group_size=merge_batch_size)
+            buckets[(bioma, int(uf_code))] = bucket_dir
+
+        print(f"Bloco {n_chunk + 1} lido ({len(chunk)} linhas)")
+
+    if not buckets:
+        raise ValueError(f"Nenhuma linha encontrada em {raw_path}.")
+
+    if to_csv:
+        os.makedirs(os.path.dirname(processed_path) or ".", exist_ok=True)
+        if os.path.exists(processed_path):
+            os.remove(processed_path)
+    elif os.path.isdir(processed_path):
+        shutil.rmtree(processed_path)
+
+    # Anos vistos por município, unidos bucket a bucket (um município aparece em mais de um bioma)
+    years_per_mun = {}
+    years_per_mun_bioma_parts = []
+
+    for bioma, uf_code in sorted(buckets):
+        bucket_dir = buckets[(bioma, uf_code)]
+        runs = [os.path.join(bucket_dir, name) for name in sorted(os.listdir(bucket_dir))]
+        bucket_years = {}
+        writer = None
+
+        for piece in _merge_sorted_runs(runs, merge_batch_size):
+            # Resumos de integridade acumulados pedaço a pedaço
+            for municipio_id, anos in piece.groupby("id_municipio")["ano"].unique().items():
+                bucket_years.setdefault(int(municipio_id), set()).update(anos.tolist())
+
+            if to_csv:
+                piece.to_csv(processed_path, mode="a", header=not os.path.exists(processed_path),
+                             index=False, encoding="utf-8")
+            else:
+                table = pa.Table.from_pandas(piece.drop(columns="bioma"), preserve_index=False)
+                if writer is None:
+                    part_dir = os.path.join(processed_path, f"bioma={bioma}")
+                    os.makedirs(part_dir, exist_ok=True)
+                    writer = pq.ParquetWriter(os.path.join(part_dir, f"part-{uf_code:02d}.parquet"), table.schema)
+                writer.write_table(table)
+
+        if writer is not None:
+            writer.close()
+
+        for municipio_id, anos in bucket_years.items():
+            years_per_mun.setdefault(municipio_id, set()).update(anos)
+        years_per_mun_bioma_parts.append(pd.DataFrame({
+            "id_municipio": list(bucket_years),
+            "anos": [len(anos) for anos in bucket_years.values()],
+            "bioma": bioma,
+        }))
+
+        shutil.rmtree(bucket_dir)
+
+    if own_spill:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    agg_years_per_mun = pd.Series(
+        {municipio_id: len(anos) for municipio_id, anos in years_per_mun.items()}, name="ano"
+    ).describe()
+    print("\nDistribuição do número de anos por município:")
+    print(agg_years_per_mun.to_string())
+
+    agg_years_per_mun_bioma = pd.concat(years_per_mun_bioma_parts, ignore_index=True).groupby("bioma")["anos"].describe()
+    print("\nDistribuição por bioma:")
+    print(agg_years_per_mun_bioma)
+
+    print(f"\nArquivo processado salvo em: {processed_path}")
+
+    return processed_path, {"anos_por_municipio": agg_years_per_mun, "anos_por_bioma": agg_years_per_mun_bioma}
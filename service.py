@@ -0,0 +1,358 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import time
+import warnings
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from pre_processing.pre_processing import load_processed
+from splitter.series_store import SeriesStore
+from splitter.train_val_split import SeriesSplit, split_years_for
+from model.registry import available_models, get_model, model_label, model_params
+
+# Mesmos ajustes do lote: o paralelismo fica no pool de processos do serviço
+SERVICE_PARAMS = {
+    "random_forest": {"n_jobs": 1},
+}
+
+LATENCY_WINDOW = 10_000
+
+
+def fit_series(key, years, values, model_names, windows):
+    # Executado no pool de processos: ajusta os modelos pedidos para uma série que não estava no lote
+    warnings.filterwarnings("ignore")
+    split = SeriesSplit(years, values, **windows)
+    forecasts = {}
+    errors = {}
+    for name in model_names:
+        label = model_label(name)
+        try:
+            result = get_model(name)(split, **{**model_params(name), **SERVICE_PARAMS.get(name, {})})
+        except Exception as e:
+            errors[label] = f"{type(e).__name__}: {e}"
+            continue
+        forecasts[label] = {
+            "validacao": {int(year): float(pred) for year, pred in result["validation_predictions"].items()},
+            "previsao": {int(year): float(pred) for year, pred in zip(result["pred_years"], result["predictions"])},
+        }
+    return key, forecasts, errors
+
+
+def _clean(value):
+    # json.dumps escreveria NaN, que não é JSON válido
+    if isinstance(value, dict):
+        return {str(k): _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def load_precomputed(results_dir):
+    # Saída do batch.py: previsoes/bioma=X/part-NNNNN.parquet, uma linha por (série, modelo, ano, tipo)
+    path = os.path.join(results_dir, "previsoes")
+    if not os.path.isdir(path):
+        raise ValueError(f"Resultados do lote não encontrados em {path} — rode batch.py antes.")
+
+    df = pd.read_parquet(path)
+    df["bioma"] = df["bioma"].astype(str)
+    df = df.sort_values(["bioma", "id_municipio", "Modelo", "tipo", "ano"], kind="stable")
+
+    forecasts = {}
+    ids = df["id_municipio"].to_numpy()
+    biomas = df["bioma"].to_numpy()
+    modelos = df["Modelo"].to_numpy()
+    tipos = df["tipo"].to_numpy()
+    anos = df["ano"].to_numpy()
+    previstos = df["previsto"].to_numpy(dtype=np.float64)
+
+    for i in range(len(df)):
+        series = forecasts.setdefault((int(ids[i]), biomas[i]), {})
+        model = series.setdefault(modelos[i], {"validacao": {}, "previsao": {}})
+        model[tipos[i]][int(anos[i])] = float(previstos[i])
+
+    # Totais por bioma já somados: a consulta por bioma não percorre as séries
+    totals = (
+        df[df["tipo"] == "previsao"]
+        .groupby(["bioma", "Modelo", "ano"], sort=True)["previsto"]
+        .agg(["sum", "count"])
+    )
+    bioma_totals = {}
+    for (bioma, modelo, ano), row in totals.iterrows():
+        bioma_totals.setdefault(bioma, {}).setdefault(modelo, {})[int(ano)] = {
+            "total": float(row["sum"]), "series": int(row["count"])
+        }
+
+    return forecasts, bioma_totals
+
+
+class LatencyStats:
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples = {}
+        self.counts = {}
+        self.window = window
+
+    def record(self, route, seconds):
+        self.samples.setdefault(route, deque(maxlen=self.window)).append(seconds)
+        self.counts[route] = self.counts.get(route, 0) + 1
+
+    def summary(self):
+        out = {}
+        for route, samples in self.samples.items():
+            ms = np.asarray(samples) * 1000
+            out[route] = {
+                "requisicoes": self.counts[route],
+                "media_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        return out
+
+
+class ForecastService:
+    def __init__(self, processed_path, results_dir=None, model_names=None, lru_size=1024, n_workers=None):
+        self.model_names = model_names or available_models()
+        unknown = [name for name in self.model_names if name not in available_models()]
+        if unknown:
+            raise ValueError(f"Modelos desconhecidos: {unknown}. Disponíveis: {available_models()}")
+        self.lru_size = lru_size
+        self.n_workers = n_workers or os.cpu_count() or 1
+
+        df = load_processed(processed_path, columns=["id_municipio", "bioma", "ano", "desmatado"])
+        self.store = SeriesStore(df)
+
+        self.windows = split_years_for(int(df["ano"].max()))
+        self.precomputed, self.bioma_totals = {}, {}
+        if results_dir is not None:
+            manifest_path = os.path.join(results_dir, "_manifest.json")
+            if os.path.exists(manifest_path):
+                # Janelas do lote valem também para os ajustes sob demanda, para as respostas serem comparáveis
+                with open(manifest_path, encoding="utf-8") as f:
+                    manifest = json.load(f)
+                self.windows.update({k: manifest[k] for k in ("train_end", "val_start", "val_end", "future_years")
+                                     if k in manifest})
+            self.precomputed, self.bioma_totals = load_precomputed(results_dir)
+
+        self.lru = OrderedDict()
+        self.in_flight = {}
+        self.executor = None
+        self.latency = LatencyStats()
+        self.hits = {"lote": 0, "lru": 0}
+        self.misses = 0
+        self.fits = 0
+        self.fit_errors = 0
+
+        print(f"{len(self.store)} séries indexadas; {len(self.precomputed)} com previsões do lote.")
+
+    def start(self):
+        if self.executor is None:
+            # spawn: o processo do serviço já tem threads (pyarrow, asyncio) e fork herdaria travas delas
+            self.executor = ProcessPoolExecutor(max_workers=self.n_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def _lru_put(self, key, value):
+        self.lru[key] = value
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    async def query_series(self, municipio_id, bioma):
+        key = (int(municipio_id), str(bioma))
+        if key not in self.store:
+            raise KeyError(f"Município {municipio_id} no bioma {bioma} não encontrado.")
+
+        if key in self.precomputed:
+            self.hits["lote"] += 1
+            return {"fonte": "lote", "modelos": self.precomputed[key]}
+
+        if key in self.lru:
+            self.hits["lru"] += 1
+            self.lru.move_to_end(key)
+            return {"fonte": "lru", **self.lru[key]}
+
+        # Série sem anos de treino ou validação nas janelas do serviço: erro do pedido, não falha de ajuste
+        years, values = self.store.get(*key)
+        SeriesSplit(years, values, **self.windows)
+
+        # Pedidos simultâneos da mesma série esperam o mesmo ajuste
+        self.misses += 1
+        future = self.in_flight.get(key)
+        if future is None:
+            self.start()
+            self.fits += 1
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, fit_series, key, np.array(years), np.array(values), self.model_names, self.windows)
+            self.in_flight[key] = future
+        try:
+            _, forecasts, errors = await future
+        except Exception as e:
+            self.fit_errors += 1
+            raise RuntimeError(f"Falha ao ajustar {key}: {type(e).__name__}: {e}") from None
+        finally:
+            self.in_flight.pop(key, None)
+
+        entry = {"modelos": forecasts, "erros": errors}
+        self._lru_put(key, entry)
+        return {"fonte": "ajuste", **entry}
+
+    def query_bioma(self, bioma):
+        if bioma not in self.bioma_totals:
+            raise KeyError(f"Bioma {bioma} sem previsões do lote.")
+        return {"bioma": bioma, "modelos": self.bioma_totals[bioma]}
+
+    def metrics(self):
+        lookups = self.hits["lote"] + self.hits["lru"] + self.misses
+        return {
+            "acertos_lote": self.hits["lote"],
+            "acertos_lru": self.hits["lru"],
+            "faltas": self.misses,
+            "ajustes": self.fits,
+            "falhas_de_ajuste": self.fit_errors,
+            "taxa_de_acerto": (self.hits["lote"] + self.hits["lru"]) / lookups if lookups else 0.0,
+            "lru": {"entradas": len(self.lru), "capacidade": self.lru_size},
+            "latencia": self.latency.summary(),
+        }
+
+    async def handle_request(self, path, params):
+        if path == "/previsao":
+            try:
+                municipio_id = int(params["id_municipio"][0])
+                bioma = params["bioma"][0]
+            except (KeyError, ValueError):
+                return 400, {"erro": "Informe id_municipio (inteiro) e bioma."}
+            try:
+                result = await self.query_series(municipio_id, bioma)
+            except KeyError as e:
+                return 404, {"erro": str(e.args[0])}
+            except ValueError as e:
+                return 422, {"erro": str(e)}
+            except RuntimeError as e:
+                return 500, {"erro": str(e)}
+            if "modelo" in params:
+                result = {**result, "modelos": {m: v for m, v in result["modelos"].items() if m in params["modelo"]}}
+            return 200, {"id_municipio": municipio_id, "bioma": bioma, **result}
+
+        if path == "/bioma":
+            if "bioma" not in params:
+                return 400, {"erro": "Informe o bioma."}
+            try:
+                return 200, self.query_bioma(params["bioma"][0])
+            except KeyError as e:
+                return 404, {"erro": str(e.args[0])}
+
+        if path == "/metricas":
+            return 200, self.metrics()
+
+        if path == "/saude":
+            return 200, {"status": "ok", "series": len(self.store), "janelas": self.windows}
+
+        return 404, {"erro": f"Rota desconhecida: {path}"}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                start = time.perf_counter()
+                try:
+                    method, target, _ = request_line.decode("utf-8", errors="replace").split(" ", 2)
+                except ValueError:
+                    status, payload, route = 400, {"erro": "Requisição inválida."}, "invalida"
+                else:
+                    url = urlsplit(target)
+                    route = url.path
+                    if method != "GET":
+                        status, payload = 405, {"erro": "Só GET é suportado."}
+                    else:
+                        status, payload = await self.handle_request(url.path, parse_qs(url.query))
+
+                body = json.dumps(_clean(payload), ensure_ascii=False).encode("utf-8")
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+                self.latency.record(route if route in _ROUTES else "desconhecida", time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+_ROUTES = {"/previsao", "/bioma", "/metricas", "/saude"}
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            422: "Unprocessable Entity", 500: "Internal Server Error"}
+
+
+async def serve(service, host="127.0.0.1", port=8765):
+    service.start()
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Serviço de previsões em http://{host}:{port} (rotas: {', '.join(sorted(_ROUTES))})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço HTTP local de consulta de previsões de desmatamento.")
+    parser.add_argument("--processed", required=True, help="Base processada (diretório Parquet ou .csv)")
+    parser.add_argument("--results", default=None, help="Diretório de saída do batch.py (opcional)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--models", default=",".join(available_models()),
+                        help=f"Modelos ajustados sob demanda ({', '.join(available_models())})")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--lru-size", type=int, default=1024, help="Séries ajustadas mantidas em memória")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    service = ForecastService(
+        args.processed,
+        results_dir=args.results,
+        model_names=[m.strip() for m in args.models.split(",") if m.strip()],
+        lru_size=args.lru_size,
+        n_workers=args.workers,
+    )
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, Tuple
+from splitter.train_val_split import SeriesSplit
+
+KEY_COLS = ["bioma", "id_municipio", "ano"]
+
+
+class SeriesStore:
+    def __init__(self, df: pd.DataFrame):
+        # preprocess_and_save já entrega a tabela ordenada; só reordena se necessário
+        if not pd.MultiIndex.from_frame(df[KEY_COLS]).is_monotonic_increasing:
+            df = df.sort_values(KEY_COLS, kind="stable")
+        self.df = df.reset_index(drop=True)
+
+        self.ano = self.df["ano"].to_numpy()
+        self.desmatado = self.df["desmatado"].to_numpy()
+
+        ids = self.df["id_municipio"].to_numpy()
+        biomas = self.df["bioma"].astype(str).to_numpy()
+
+        n = len(self.df)
+        if n == 0:
+            raise ValueError("Dataframe vazio — nenhuma série para indexar.")
+
+        # Início de cada bloco contíguo (id_municipio, bioma)
+        boundary = np.ones(n, dtype=bool)
+        boundary[1:] = (ids[1:] != ids[:-1]) | (biomas[1:] != biomas[:-1])
+        starts = np.flatnonzero(boundary)
+        ends = np.append(starts[1:], n)
+
+        self.index: Dict[Tuple[int, str], Tuple[int, int]] = {
+            (int(ids[s]), str(biomas[s])): (int(s), int(e)) for s, e in zip(starts, ends)
+        }
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key) -> bool:
+        return key in self.index
+
+    def keys(self):
+        return self.index.keys()
+
+    def _range(self, municipio_id: int, bioma: str) -> Tuple[int, int]:
+        try:
+            return self.index[(int(municipio_id), str(bioma))]
+        except KeyError:
+            raise ValueError(f"Município {municipio_id} no bioma {bioma} não encontrado no dataframe.") from None
+
+    def get(self, municipio_id: int, bioma: str) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self._range(municipio_id, bioma)
+        return self.ano[start:end], self.desmatado[start:end]
+
+    def get_municipio_df(self, municipio_id: int, bioma: str) -> pd.DataFrame:
+        start, end = self._range(municipio_id, bioma)
+        return self.df.iloc[start:end].reset_index(drop=True)
+
+    def split(self, municipio_id: int, bioma: str, **split_kwargs) -> SeriesSplit:
+        ano, desmatado = self.get(municipio_id, bioma)
+        return SeriesSplit(ano, desmatado, **split_kwargs)
+
+    def __iter__(self) -> Iterator[Tuple[Tuple[int, str], np.ndarray, np.ndarray]]:
+        for key, (start, end) in self.index.items():
+            yield key, self.ano[start:end], self.desmatado[start:end]
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from typing import Tuple, List
 
@@ -19,7 +20,7 @@ def train_val_split(df_filtrado: pd.DataFrame,
                     future_years: List[int] = None) -> Tuple[pd.DataFrame, pd.DataFrame, List[int]]:
 
     if future_years is None:
-        future_years = [2024, 2025, 2026, 2027, 2028]
+        future_years = list(range(val_end + 1, val_end + 6))
 
     train_df = df_filtrado[df_filtrado["ano"] <= train_end].copy()
     val_df = df_filtrado[(df_filtrado["ano"] >= val_start) & (df_filtrado["ano"] <= val_end)].copy()
@@ -29,4 +30,99 @@ def train_val_split(df_filtrado: pd.DataFrame,
     if val_df.empty:
         raise ValueError("Val dataframe ficou vazio — verifique val_start/val_end.")
 
-    return train_df, val_df, future_years
\ No newline at end of file
+    return train_df, val_df, future_years
+
+
+def split_years_for(last_year: int, val_years: int = 3, horizon: int = 5) -> dict:
+    # Janelas derivadas do último ano publicado: 2023 -> treino até 2020, validação 2021-2023, futuro 2024-2028
+    last_year = int(last_year)
+    return {
+        "train_end": last_year - val_years,
+        "val_start": last_year - val_years + 1,
+        "val_end": last_year,
+        "future_years": list(range(last_year + 1, last_year + horizon + 1)),
+    }
+
+
+class SeriesMatrix:
+    def __init__(self, keys: List[Tuple[int, str]], years: np.ndarray, values: np.ndarray):
+        # keys[i] = (id_municipio, bioma) da linha i; anos sem observação ficam como NaN
+        self.keys = keys
+        self.years = years
+        self.values = values
+
+    @property
+    def observed(self) -> np.ndarray:
+        return ~np.isnan(self.values)
+
+    def window_mask(self, start: int = None, end: int = None) -> np.ndarray:
+        cols = np.ones(len(self.years), dtype=bool)
+        if start is not None:
+            cols &= self.years >= start
+        if end is not None:
+            cols &= self.years <= end
+        return self.observed & cols
+
+
+def build_series_matrix(df: pd.DataFrame, value_col: str = "desmatado") -> SeriesMatrix:
+    wide = df.set_index(["id_municipio", "bioma", "ano"])[value_col].unstack("ano").sort_index()
+
+    if wide.empty:
+        raise ValueError("Nenhuma série encontrada no dataframe.")
+
+    keys = [(int(m), str(b)) for m, b in wide.index]
+    years = wide.columns.to_numpy(dtype=np.int64)
+    values = wide.to_numpy(dtype=np.float64)
+
+    return SeriesMatrix(keys, years, values)
+
+
+class SeriesSplit:
+    def __init__(self, years, values,
+                 train_end: int = 2020,
+                 val_start: int = 2021,
+                 val_end: int = 2023,
+                 future_years: List[int] = None):
+
+        if future_years is None:
+            future_years = list(range(val_end + 1, val_end + 6))
+
+        years = np.asarray(years)
+        values = np.asarray(values)
+        order = np.argsort(years, kind="stable")
+
+        # Série completa ordenada por ano (inclui anos após a validação, se houver)
+        self.years = years[order]
+        self.values = values[order]
+
+        train_mask = self.years <= train_end
+        val_mask = (self.years >= val_start) & (self.years <= val_end)
+
+        self.train_years = self.years[train_mask]
+        self.train_values = self.values[train_mask]
+        self.val_years = self.years[val_mask]
+        self.val_values = self.values[val_mask]
+        self.future_years = future_years
+
+        self.train_end = train_end
+        self.val_start = val_start
+        self.val_end = val_end
+
+        if len(self.train_years) == 0:
+            raise ValueError("Train dataframe ficou vazio — verifique train_end.")
+        if len(self.val_years) == 0:
+            raise ValueError("Val dataframe ficou vazio — verifique val_start/val_end.")
+
+
+def split_series(data,
+                 train_end: int = 2020,
+                 val_start: int = 2021,
+                 val_end: int = 2023,
+                 future_years: List[int] = None) -> SeriesSplit:
+    # Um SeriesSplit já pronto é repassado sem recalcular nada
+    if isinstance(data, SeriesSplit):
+        return data
+
+    return SeriesSplit(data["ano"].to_numpy(), data["desmatado"].to_numpy(),
+                       train_end=train_end, val_start=val_start, val_end=val_end,
+                       future_years=future_years)